@@ -1,30 +1,21 @@
 # app_streamlit.py
 import os
-import json
 import hashlib
 from pathlib import Path
 
 import pandas as pd
 import streamlit as st
 
+#Learn / Progress only need these; the retrieval stack (torch, FAISS, LangChain)
+#is imported on the first question
 from src.manifest import load_manifest
-from src.agentic import answer
+from src.client import get_client
+from src.progress_store import get_progress_store
 from src.config import settings
 
 st.set_page_config(page_title="EU Navigator (PLP)", layout="wide")
 st.set_option("client.showErrorDetails", True)
 
-PROGRESS_PATH = Path("user_progress.json")
-
-
-def load_progress():
-    if PROGRESS_PATH.exists():
-        return json.loads(PROGRESS_PATH.read_text())
-    return {}
-
-def save_progress(state):
-    PROGRESS_PATH.write_text(json.dumps(state, indent=2))
-
 def force_bullets(text: str) -> str:
     return (text or "").replace("•", "\n\n•").strip()
 
@@ -34,8 +25,8 @@ def download_button_for_pdf(pdf_path: str, label_prefix: str, key_suffix: str):
     if not p.exists():
         st.warning(f"PDF not found on disk: {pdf_path}")
         return
-    data = p.read_bytes()
-    
+    data = pdf_bytes(str(p), p.stat().st_mtime)
+
     #Unique key for this downlaod button
     uniq = hashlib.md5((str(p.resolve()) + "|" + key_suffix).encode()).hexdigest()
     st.download_button(
@@ -47,10 +38,65 @@ def download_button_for_pdf(pdf_path: str, label_prefix: str, key_suffix: str):
         use_container_width=False,
     )
 
+#Read once per (path, mtime) and shared by every session; bounded so large PDFs don't pile up
+@st.cache_data(max_entries=32, show_spinner=False)
+def pdf_bytes(path: str, mtime: float) -> bytes:
+    return Path(path).read_bytes()
+
+#Manifest table plus dict indexes, rebuilt only when the CSV changes
+@st.cache_resource
+def load_catalog(path: str, mtime: float):
+    rows = load_manifest(path)
+    df = pd.DataFrame([r.__dict__ for r in rows])
+    by_id = {r.doc_id: r for r in rows}
+    by_module = {}
+    for r in rows:
+        by_module.setdefault(r.module, []).append(r)
+    return df, by_id, by_module
+
+#One SQLite connection for all sessions; writes happen only in widget callbacks
+@st.cache_resource
+def progress_store():
+    return get_progress_store()
+
+def _save_done(module: str, doc_id: str, key: str):
+    progress_store().set_done(module, doc_id, st.session_state[key])
+
+def _save_note(module: str, doc_id: str, key: str):
+    progress_store().set_note(module, doc_id, st.session_state[key])
+
+#Embedder + FAISS stay resident across reruns and sessions
+@st.cache_resource(show_spinner="Loading retrieval models...")
+def retrieval_engine():
+    from src.retrieval import get_engine
+    return get_engine().warmup()
+
+#With NAVIGATOR_SERVER set, questions go to the shared query service instead
+@st.cache_resource
+def navigator_client():
+    return get_client()
+
+def render_sources(srcs):
+    if not srcs:
+        st.caption("No sources returned.")
+        return
+    for i, s in enumerate(srcs):
+        did = s.get("doc_id", "UNKNOWN")
+        label = f"[{did}: {s.get('section','') or ''}] — {s.get('title','')} ({s.get('module','')})"
+        st.write(f"- {label}")
+        src_pdf = by_id[did].pdf_path if did in by_id else None
+        if src_pdf and Path(src_pdf).exists():
+            download_button_for_pdf(
+                src_pdf,
+                label_prefix=f"Download {did}",
+                key_suffix=f"src_{i}_{did}",
+            )
+        else:
+            st.caption("  ↳ PDF not available or missing on disk.")
+
 #Loading Manifest
-rows = load_manifest(str(settings.manifest_csv))
-df = pd.DataFrame([r.__dict__ for r in rows])
-pdf_by_id = {r.doc_id: r.pdf_path for r in rows}
+manifest_path = Path(settings.manifest_csv)
+df, by_id, by_module = load_catalog(str(manifest_path), manifest_path.stat().st_mtime)
 
 
 #UI 
@@ -64,31 +110,29 @@ with tabs[0]:
     if df.empty:
         st.error("Manifest is empty. Check settings.manifest_csv and your data folders.")
     else:
-        modules = sorted(df["module"].unique().tolist())
+        modules = sorted(by_module)
         m = st.selectbox("Select module", modules)
 
-        mdf = df[df["module"] == m].copy()
-        progress = load_progress()
-        progress.setdefault(m, {})
+        mdocs = by_module[m]
+        progress = progress_store().module(m)
 
         left, right = st.columns([0.5, 0.5], gap="large")
 
         with left:
             st.write("**Documents**")
-            for _, r in mdf.iterrows():
-                doc_id = r["doc_id"]
-                title = r["title"]
-                done = progress[m].get(doc_id, {}).get("done", False)
+            completed = 0
+            for r in mdocs:
+                doc_id = r.doc_id
+                key = f"done_{m}_{doc_id}"
+                done = progress.get(doc_id, {}).get("done", False)
                 col1, col2 = st.columns([0.75, 0.25])
                 with col1:
-                    st.write(f"**{title}**  \n`{doc_id}`")
+                    st.write(f"**{r.title}**  \n`{doc_id}`")
                 with col2:
-                    new_done = st.checkbox("Done", value=done, key=f"done_{m}_{doc_id}")
-                    progress[m].setdefault(doc_id, {})["done"] = new_done
-            save_progress(progress)
+                    done = st.checkbox("Done", value=done, key=key, on_change=_save_done, args=(m, doc_id, key))
+                completed += bool(done)
 
-            total = len(mdf)
-            completed = sum(1 for r in mdf["doc_id"] if progress[m].get(r, {}).get("done"))
+            total = len(mdocs)
             st.progress(0 if total == 0 else completed / total)
             st.caption(f"{completed}/{total} completed")
 
@@ -96,22 +140,21 @@ with tabs[0]:
             st.write("**Download current document**")
             which = st.selectbox(
                 "Select document to download",
-                mdf["doc_id"].tolist(),
-                format_func=lambda x: df[df["doc_id"] == x]["title"].iloc[0],
+                [r.doc_id for r in mdocs],
+                format_func=lambda x: by_id[x].title,
                 key=f"open_{m}",
             )
-            pdf_path = df[df["doc_id"] == which]["pdf_path"].iloc[0]
             download_button_for_pdf(
-                pdf_path,
+                by_id[which].pdf_path,
                 label_prefix="Download",
                 key_suffix=f"learn_{m}_{which}",
             )
 
             st.markdown("### ✍️ Reflection / Notes")
-            curr = progress[m].setdefault(which, {}).get("note", "")
-            new_note = st.text_area("Notes for this document", value=curr, height=140, key=f"note_{m}_{which}")
-            progress[m][which]["note"] = new_note
-            save_progress(progress)
+            key = f"note_{m}_{which}"
+            curr = progress.get(which, {}).get("note", "")
+            st.text_area("Notes for this document", value=curr, height=140, key=key,
+                         on_change=_save_note, args=(m, which, key))
 
 #Ask Tab
 with tabs[1]:
@@ -123,45 +166,62 @@ with tabs[1]:
         if not q.strip():
             st.warning("Please enter a question.")
         else:
-            with st.spinner("Retrieving and synthesizing..."):
-                out = answer(q, module=module_opt or None)
-
+            client = navigator_client()
+            if client is not None:
+                events = client.answer_stream(q, module=module_opt or None)
+            else:
+                from src.agentic import answer_stream
+                retrieval_engine()
+                events = answer_stream(q, module=module_opt or None)
+            #Layout is fixed up front; each block fills in as its stage finishes
             st.markdown("### Answer")
-            st.markdown(force_bullets(out.get("answer", "")))
-
+            status = st.empty()
+            answer_box = st.container()
             st.divider()
             st.subheader("💬 Reviewer Notes")
-            st.info(out.get("review", ""))
-
+            review_box = st.empty()
             st.markdown("### Sources")
-            srcs = out.get("sources", [])
-            if not srcs:
-                st.caption("No sources returned.")
-            else:
-                for i, s in enumerate(srcs):
-                    did = s.get("doc_id", "UNKNOWN")
-                    label = f"[{did}: {s.get('section','') or ''}] — {s.get('title','')} ({s.get('module','')})"
-                    st.write(f"- {label}")
-                    src_pdf = pdf_by_id.get(did)
-                    if src_pdf and Path(src_pdf).exists():
-                        download_button_for_pdf(
-                            src_pdf,
-                            label_prefix=f"Download {did}",
-                            key_suffix=f"src_{i}_{did}",
-                        )
-                    else:
-                        st.caption("  ↳ PDF not available or missing on disk.")
+            sources_box = st.container()
+
+            status.caption("Planning sub-questions…")
+            part_slots, part_text, review_text = {}, {}, ""
+            for ev in events:
+                kind = ev["type"]
+                if kind == "plan":
+                    status.caption("Retrieving and reranking…")
+                elif kind == "sources":
+                    with sources_box:
+                        render_sources(ev["sources"])
+                    with answer_box:
+                        for i, sq in enumerate(ev["sub_questions"]):
+                            if i:
+                                st.markdown("---")
+                            st.markdown(f"**Sub-question:** {sq}")
+                            part_slots[i] = st.empty()
+                    status.caption("Writing answer…")
+                elif kind == "token":
+                    i = ev["index"]
+                    part_text[i] = part_text.get(i, "") + ev["text"]
+                    part_slots[i].markdown(force_bullets(part_text[i]) + " ▌")
+                elif kind == "part":
+                    part_slots[ev["index"]].markdown(force_bullets(ev["text"]))
+                    status.caption("Reviewing…")
+                elif kind == "review_token":
+                    review_text += ev["text"]
+                    review_box.info(review_text + " ▌")
+                elif kind == "done":
+                    review_box.info(ev["result"].get("review", ""))
+                    status.empty()
 
 #Progress Tab
 with tabs[2]:
     st.subheader("Progress Overview")
-    progress = load_progress()
+    progress = progress_store().all()
 
     records = []
     for m in sorted(progress.keys()):
         for doc_id, info in progress[m].items():
-            rowmask = (df["doc_id"] == doc_id)
-            title = df[rowmask]["title"].iloc[0] if rowmask.any() else doc_id
+            title = by_id[doc_id].title if doc_id in by_id else doc_id
             records.append({
                 "module": m,
                 "doc_id": doc_id,
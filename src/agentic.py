@@ -1,26 +1,43 @@
-import argparse, json
-from typing import Dict, Any, Optional, List
+import argparse, json, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, Optional, List
 from collections import Counter
 
-from .planner import plan
-from .retrieval import retrieve_and_rerank
-from .synthesizer import synthesize
-from .reviewer import review
+from .answer_cache import get_answer_cache
+from .client import get_client
+from .config import settings
+from .ollama_client import NUM_PARALLEL, set_llm_concurrency
+from .planner import plan, planner_metrics, PLANNER_MODEL
+from .synthesizer import synthesize, synthesize_stream, _format_output, WRITER_MODEL
+from .reviewer import review, review_stream
+from .tracing import bind, breakdown, span, trace_stream, traced
 
-def answer(question: str, module: Optional[str] = None, skip_review: bool = False) -> Dict[str, Any]:
-    plan_out = plan(question)
-    subqs: List[str] = plan_out.get("sub_questions", [question]) or [question]
+def _engine():
+    #Imported on first use: --help and --server runs never load the retrieval stack
+    from .retrieval import get_engine
+    return get_engine()
 
-    all_docs, parts = [], []
-    for sq in subqs:
-        docs = retrieve_and_rerank(sq, module_filter=module)
-        all_docs.extend(docs)
-        part = synthesize(sq, docs)
-        parts.append(f"**Sub-question:** {sq}\n{part}")
+#(sub-questions, module) -> reranked docs per sub-question; the server swaps in its micro-batcher
+Retriever = Callable[[List[str], Optional[str]], List[List[Any]]]
 
-    merged = "\n\n---\n\n".join(parts)
-    critique = "" if skip_review else review(question, merged)
+def _retrieve_local(subqs: List[str], module: Optional[str]) -> List[List[Any]]:
+    return _engine().retrieve_and_rerank_many(subqs, module_filter=module)
+
+def _map_bounded(fn: Callable, items: List[Any], concurrency: int) -> List[Any]:
+    """map() over a bounded thread pool; results come back in input order."""
+    if concurrency <= 1 or len(items) <= 1:
+        return [fn(x) for x in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as ex:
+        return list(ex.map(bind(fn), items))
+
+def _timed(fn: Callable) -> Callable:
+    def run(arg):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        return out, time.perf_counter() - t0
+    return run
 
+def _sources(all_docs: List[Any]) -> List[Dict[str, str]]:
     seen, sources = set(), []
     for d in all_docs:
         did = d.metadata.get("doc_id")
@@ -33,21 +50,209 @@ def answer(question: str, module: Optional[str] = None, skip_review: bool = Fals
             "module": d.metadata.get("module",""),
         })
         seen.add(did)
+    return sources
+
+#Answer cache: any change to the index or to the models invalidates entries
+def _cache_version(engine) -> str:
+    return "|".join([engine.version, PLANNER_MODEL, WRITER_MODEL, settings.embedding_model, settings.reranker_model])
+
+@traced("answer_cache")
+def _cache_lookup(question: str, module: Optional[str], skip_review: bool):
+    engine = _engine().warmup(rerank=False)
+    cache = get_answer_cache(_cache_version(engine))
+    scope = (module or "") + ("|noreview" if skip_review else "")
+    emb = engine.embeddings.embed_query(question) if cache.semantic_threshold is not None else None
+    hit = cache.get(question, scope, embedding=emb)
+    if hit is None:
+        return cache, scope, emb, None
+    payload, kind = hit
+    return cache, scope, emb, {**payload, "cached": kind}
+
+def _replay(result: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Stream events for a cached answer so UIs render it the same way."""
+    subqs = result["plan"].get("sub_questions") or [result["question"]]
+    yield {"type": "plan", "plan": result["plan"]}
+    yield {"type": "sources", "sub_questions": subqs, "sources": result["sources"]}
+    for i, (sq, chunk) in enumerate(zip(subqs, result["answer"].split("\n\n---\n\n"))):
+        part = chunk.split("\n", 1)[1] if chunk.startswith("**Sub-question:**") and "\n" in chunk else chunk
+        yield {"type": "part", "index": i, "sub_question": sq, "text": part}
+    if result.get("review"):
+        yield {"type": "review_token", "text": result["review"]}
+    yield {"type": "done", "result": result}
+
+@traced("answer")
+def answer(
+    question: str,
+    module: Optional[str] = None,
+    skip_review: bool = False,
+    concurrency: Optional[int] = None,
+    use_cache: bool = True,
+    retrieve: Optional[Retriever] = None,
+) -> Dict[str, Any]:
+    """
+    Plan -> retrieve/rerank -> synthesize -> review. Sub-question syntheses run
+    concurrently (up to `concurrency`, default OLLAMA_NUM_PARALLEL, and never
+    past the process-wide cap set by set_llm_concurrency) and are merged back
+    in plan order. Repeated questions are served from the answer cache.
+    `retrieve` replaces the in-process retrieve + rerank of the sub-questions.
+    """
+    concurrency = NUM_PARALLEL if concurrency is None else concurrency
+    timings: Dict[str, Any] = {}
+    t_start = time.perf_counter()
+
+    if use_cache:
+        cache, scope, q_emb, hit = _cache_lookup(question, module, skip_review)
+        if hit is not None:
+            return hit
+
+    t0 = time.perf_counter()
+    plan_out = plan(question)
+    timings["plan_s"] = time.perf_counter() - t0
+    subqs: List[str] = plan_out.get("sub_questions", [question]) or [question]
+
+    #All sub-questions go through the cross-encoder in one batch
+    t0 = time.perf_counter()
+    docs_per_sq = (retrieve or _retrieve_local)(subqs, module)
+    timings["retrieve_rerank_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    synth = _timed(lambda job: synthesize(*job))
+    results = _map_bounded(synth, list(zip(subqs, docs_per_sq)), concurrency)
+    timings["synthesize_s"] = time.perf_counter() - t0
+    timings["synthesize_parts_s"] = [dt for _, dt in results]
+
+    all_docs, parts = [], []
+    for sq, docs, (part, _) in zip(subqs, docs_per_sq, results):
+        all_docs.extend(docs)
+        parts.append(f"**Sub-question:** {sq}\n{part}")
+
+    merged = "\n\n---\n\n".join(parts)
+    t0 = time.perf_counter()
+    critique = "" if skip_review else review(question, merged)
+    timings["review_s"] = time.perf_counter() - t0
+    timings["total_s"] = time.perf_counter() - t_start
 
-    return {
+    result = {
         "question": question,
         "plan": plan_out,
-        "sources": sources,
+        "sources": _sources(all_docs),
         "answer": merged,
         "review": critique,
+        "timings": timings,
     }
+    if use_cache:
+        cache.put(question, scope, result, embedding=q_emb)
+    return result
+
+def answer_stream(
+    question: str,
+    module: Optional[str] = None,
+    skip_review: bool = False,
+    use_cache: bool = True,
+    retrieve: Optional[Retriever] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Same pipeline as answer(), but yields events as work completes so a UI can
+    render progressively:
+      {"type": "plan"}, {"type": "sources"} once reranking is done,
+      {"type": "token"/"part"} per sub-question, {"type": "review_token"},
+      and finally {"type": "done", "result": <answer() dict>}.
+    Sub-questions stream one after another so tokens arrive in plan order.
+    """
+    return trace_stream("answer", _answer_events(question, module, skip_review, use_cache, retrieve))
+
+def _answer_events(
+    question: str,
+    module: Optional[str],
+    skip_review: bool,
+    use_cache: bool,
+    retrieve: Optional[Retriever] = None,
+) -> Iterator[Dict[str, Any]]:
+    timings: Dict[str, Any] = {}
+    t_start = time.perf_counter()
+
+    if use_cache:
+        cache, scope, q_emb, hit = _cache_lookup(question, module, skip_review)
+        if hit is not None:
+            yield from _replay(hit)
+            return
+
+    t0 = time.perf_counter()
+    plan_out = plan(question)
+    timings["plan_s"] = time.perf_counter() - t0
+    subqs: List[str] = plan_out.get("sub_questions", [question]) or [question]
+    yield {"type": "plan", "plan": plan_out}
 
-    
+    t0 = time.perf_counter()
+    docs_per_sq = (retrieve or _retrieve_local)(subqs, module)
+    timings["retrieve_rerank_s"] = time.perf_counter() - t0
+    all_docs = [d for docs in docs_per_sq for d in docs]
+    sources = _sources(all_docs)
+    yield {"type": "sources", "sub_questions": subqs, "sources": sources}
+
+    t0 = time.perf_counter()
+    parts, part_times = [], []
+    for i, (sq, docs) in enumerate(zip(subqs, docs_per_sq)):
+        tp = time.perf_counter()
+        toks = []
+        for tok in synthesize_stream(sq, docs):
+            toks.append(tok)
+            yield {"type": "token", "index": i, "sub_question": sq, "text": tok}
+        part = _format_output("".join(toks))
+        part_times.append(time.perf_counter() - tp)
+        parts.append(f"**Sub-question:** {sq}\n{part}")
+        yield {"type": "part", "index": i, "sub_question": sq, "text": part}
+    timings["synthesize_s"] = time.perf_counter() - t0
+    timings["synthesize_parts_s"] = part_times
+
+    merged = "\n\n---\n\n".join(parts)
+    t0 = time.perf_counter()
+    critique = ""
+    if not skip_review:
+        toks = []
+        for tok in review_stream(question, merged):
+            toks.append(tok)
+            yield {"type": "review_token", "text": tok}
+        critique = "".join(toks).strip()
+    timings["review_s"] = time.perf_counter() - t0
+    timings["total_s"] = time.perf_counter() - t_start
+
+    result = {
+        "question": question,
+        "plan": plan_out,
+        "sources": sources,
+        "answer": merged,
+        "review": critique,
+        "timings": timings,
+    }
+    if use_cache:
+        cache.put(question, scope, result, embedding=q_emb)
+    yield {"type": "done", "result": result}
 
 if __name__ == "__main__":
     import argparse, json
     ap = argparse.ArgumentParser()
     ap.add_argument("--q", required=True)
     ap.add_argument("--module", help="optional module filter")  
+    ap.add_argument("--concurrency", type=int, default=None,
+                    help="parallel sub-question syntheses; also raises this process's LLM cap "
+                         "(default: OLLAMA_NUM_PARALLEL; with --server the server's cap applies)")
+    ap.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    ap.add_argument("--metrics", action="store_true", help="also print planner invocation metrics")
+    ap.add_argument("--server", help="query a running src.server instead (default: $NAVIGATOR_SERVER)")
+    ap.add_argument("--trace", action="store_true", help="print a per-stage latency breakdown (local runs)")
     args = ap.parse_args()
-    print(json.dumps(answer(args.q, module=args.module), indent=2))
\ No newline at end of file
+    client = get_client(args.server)
+    if client is not None:
+        out = client.answer(args.q, module=args.module, concurrency=args.concurrency, use_cache=not args.no_cache)
+    else:
+        if args.concurrency:
+            set_llm_concurrency(args.concurrency)
+        with span("question") as root:
+            _engine().warmup()
+            out = answer(args.q, module=args.module, concurrency=args.concurrency, use_cache=not args.no_cache)
+    print(json.dumps(out, indent=2))
+    if args.trace and client is None:
+        print(breakdown(root))
+    if args.metrics and client is None:
+        print(json.dumps({"planner": planner_metrics()}, indent=2))
\ No newline at end of file
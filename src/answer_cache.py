@@ -0,0 +1,169 @@
+import hashlib, json, re, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key       TEXT PRIMARY KEY,
+    norm_q    TEXT NOT NULL,
+    module    TEXT NOT NULL,
+    version   TEXT NOT NULL,
+    created   REAL NOT NULL,
+    accessed  REAL NOT NULL,
+    hits      INTEGER NOT NULL DEFAULT 0,
+    embedding BLOB,
+    payload   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_scope ON answers(version, module);
+CREATE INDEX IF NOT EXISTS answers_accessed ON answers(accessed);
+"""
+
+def normalize_question(q: str) -> str:
+    q = re.sub(r"\s+", " ", (q or "").strip().lower())
+    return q.rstrip(" ?.!")
+
+class AnswerCache:
+    """
+    SQLite answer cache. Entries are scoped by `version` (index fingerprint +
+    model names) and module; anything written under another version is purged
+    on open. Exact lookup is on the normalized question; semantic lookup
+    compares stored bge-m3 query embeddings against `semantic_threshold`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        version: str = "",
+        ttl_s: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        semantic_threshold: Optional[float] = None,
+    ):
+        self.path = Path(path or settings.answer_cache_path)
+        self.version = version
+        self.ttl_s = settings.answer_cache_ttl_s if ttl_s is None else ttl_s
+        self.max_entries = settings.answer_cache_max_entries if max_entries is None else max_entries
+        self.semantic_threshold = semantic_threshold
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.counters = {"hits_exact": 0, "hits_semantic": 0, "misses": 0, "evicted": 0}
+        self._closed = False
+        self.purge_stale()
+
+    def _key(self, norm_q: str, module: str) -> str:
+        return hashlib.sha1(f"{self.version}|{module}|{norm_q}".encode()).hexdigest()
+
+    def purge_stale(self) -> int:
+        with self._lock, self._db:
+            n = self._db.execute("DELETE FROM answers WHERE version != ?", (self.version,)).rowcount
+            self.counters["evicted"] += n
+        return n
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl_s
+
+    def get(self, question: str, module: str = "", embedding: Optional[List[float]] = None) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Return (payload, "exact"|"semantic") or None."""
+        norm_q = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            if self._closed:
+                return None
+            row = self._db.execute(
+                "SELECT key, payload, created FROM answers WHERE key = ?",
+                (self._key(norm_q, module),),
+            ).fetchone()
+            if row is not None and row[2] < self._expired_before():
+                #Expired exact entry: a fresh paraphrase may still answer it
+                row = None
+            kind = "exact"
+            if row is None and embedding is not None and self.semantic_threshold is not None:
+                row, kind = self._nearest(module, embedding), "semantic"
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            with self._db:
+                self._db.execute("UPDATE answers SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, row[0]))
+            self.counters[f"hits_{kind}"] += 1
+        return json.loads(row[1]), kind
+
+    def _nearest(self, module: str, embedding: List[float]):
+        rows = self._db.execute(
+            "SELECT key, payload, created, embedding FROM answers "
+            "WHERE version = ? AND module = ? AND embedding IS NOT NULL AND created >= ?",
+            (self.version, module, self._expired_before()),
+        ).fetchall()
+        if not rows:
+            return None
+        q = np.asarray(embedding, dtype=np.float32)
+        mat = np.stack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+        #bge-m3 vectors are stored normalized, so the dot product is the cosine
+        sims = mat @ q
+        best = int(np.argmax(sims))
+        return rows[best][:3] if sims[best] >= self.semantic_threshold else None
+
+    def put(self, question: str, module: str, payload: Dict[str, Any], embedding: Optional[List[float]] = None) -> None:
+        norm_q = normalize_question(question)
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            if self._closed:
+                return
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers(key, norm_q, module, version, created, accessed, hits, embedding, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                    (self._key(norm_q, module), norm_q, module, self.version, now, now, blob, json.dumps(payload)),
+                )
+                self._evict()
+
+    def _evict(self) -> None:
+        n = self._db.execute("DELETE FROM answers WHERE created < ?", (self._expired_before(),)).rowcount
+        total = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if total > self.max_entries:
+            #LRU: drop the least recently accessed overflow
+            n += self._db.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed ASC LIMIT ?)",
+                (total - self.max_entries,),
+            ).rowcount
+        self.counters["evicted"] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = 0 if self._closed else self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            counters = dict(self.counters)
+        lookups = counters["hits_exact"] + counters["hits_semantic"] + counters["misses"]
+        hits = lookups - counters["misses"]
+        return {**counters, "size": size, "hit_rate": (hits / lookups) if lookups else 0.0}
+
+    def clear(self) -> None:
+        with self._lock:
+            if not self._closed:
+                with self._db:
+                    self._db.execute("DELETE FROM answers")
+
+    def close(self) -> None:
+        """Release the connection; a request still holding this cache gets misses and dropped puts."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._db.close()
+
+_CACHE: Optional[AnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_answer_cache(version: str) -> AnswerCache:
+    """Process-wide cache; re-opened (and stale rows purged) when the version changes."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.version != version:
+            if _CACHE is not None:
+                _CACHE.close()
+            _CACHE = AnswerCache(version=version, semantic_threshold=settings.answer_cache_semantic_threshold)
+    return _CACHE
@@ -1,16 +1,29 @@
 import argparse
 from typing import Optional
-from .retrieval import retrieve_and_rerank
+from .client import get_client
 from .synthesizer import synthesize
+from .tracing import breakdown, span
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--q", required=True)
     ap.add_argument("--module", help="optional module filter",
                     choices=["Equality_Foundations","Data_IP_TDM","AI_Cyber_Gov"])
+    ap.add_argument("--server", help="query a running src.server instead (default: $NAVIGATOR_SERVER)")
+    ap.add_argument("--trace", action="store_true", help="print a per-stage latency breakdown (local runs)")
     args = ap.parse_args()
 
-    docs = retrieve_and_rerank(args.q, args.module)
-    ans = synthesize(args.q, docs)
+    client = get_client(args.server)
+    if client is not None:
+        ans = client.ask(args.q, args.module)["answer"]
+    else:
+        from .retrieval import get_engine, retrieve_and_rerank
+        with span("ask") as root:
+            get_engine().warmup()
+            docs = retrieve_and_rerank(args.q, args.module)
+            ans = synthesize(args.q, docs)
     print("\n=== ANSWER ===\n")
     print(ans)
+    if args.trace and client is None:
+        print("\n=== TRACE ===\n")
+        print(breakdown(root))
@@ -0,0 +1,239 @@
+import argparse, hashlib, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from .agentic import _cache_lookup, _sources
+from .ollama_client import NUM_PARALLEL, set_llm_concurrency
+from .planner import plan
+from .reviewer import review
+from .synthesizer import synthesize
+from .tracing import bind, breakdown, span
+
+#Bulk answering: one process, models and index loaded once. Questions are taken
+#in chunks; each chunk is planned (planner model), retrieved and reranked as one
+#batch, then written and reviewed (writer model) with bounded concurrency, so
+#Ollama switches models twice per chunk rather than per question. Every result
+#is appended to the output JSONL as soon as it is done; a rerun skips rows that
+#already have a result and retries rows that failed.
+
+def _engine():
+    #Imported on first use: --help never loads the retrieval stack
+    from .retrieval import get_engine
+    return get_engine()
+
+def row_key(item: Dict[str, Any]) -> str:
+    """The row's own "id", else a hash of module + question."""
+    if item.get("id") is not None:
+        return str(item["id"])
+    blob = f"{item.get('module') or ''}|{item['question']}"
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    JSONL rows of {"question", "module"?, "id"?}. Results are matched back by
+    id, so a repeated id keeps its first row and the later ones are dropped.
+    """
+    items, seen = [], {}
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not str(item.get("question", "")).strip():
+                raise ValueError(f"{path}:{n}: row has no question")
+            item["id"] = row_key(item)
+            if item["id"] in seen:
+                print(f"[batch] {path}:{n}: duplicate id {item['id']!r} (first on line {seen[item['id']]}), skipped")
+                continue
+            seen[item["id"]] = n
+            items.append(item)
+    return items
+
+def load_done(path: Path) -> Set[str]:
+    """Ids already answered in an earlier run; a torn last line is ignored."""
+    done = set()
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "error" not in rec:
+                    done.add(rec["id"])
+    return done
+
+class ResultWriter:
+    """Appends one JSON line per finished question, flushed to disk straight away."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        #A crash mid-line leaves no newline; start on a fresh line so the next record parses
+        torn = False
+        if path.exists() and path.stat().st_size > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._f = open(path, "a", encoding="utf-8")
+        if torn:
+            self._f.write("\n")
+        self._lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.written += 1
+            self.errors += int("error" in rec)
+
+    def close(self) -> None:
+        self._f.close()
+
+def _error(item: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+    return {"id": item["id"], "module": item.get("module"), "question": item["question"],
+            "error": f"{type(e).__name__}: {e}"}
+
+def _write_answer(job: Dict[str, Any], skip_review: bool) -> Dict[str, Any]:
+    item, timings = job["item"], job["timings"]
+    t0 = time.perf_counter()
+    parts = [f"**Sub-question:** {sq}\n{synthesize(sq, docs)}" for sq, docs in zip(job["subqs"], job["docs"])]
+    timings["synthesize_s"] = time.perf_counter() - t0
+    merged = "\n\n---\n\n".join(parts)
+    t0 = time.perf_counter()
+    critique = "" if skip_review else review(item["question"], merged)
+    timings["review_s"] = time.perf_counter() - t0
+    return {
+        "question": item["question"],
+        "plan": job["plan"],
+        "sources": _sources([d for docs in job["docs"] for d in docs]),
+        "answer": merged,
+        "review": critique,
+        "timings": timings,
+    }
+
+def run_chunk(items: List[Dict[str, Any]], out: ResultWriter, concurrency: int,
+              skip_review: bool = False, use_cache: bool = True) -> None:
+    """Answer one chunk of questions and append each result to `out` as it finishes."""
+    jobs = []
+    for item in items:
+        job = {"item": item, "timings": {}}
+        if use_cache:
+            job["cache"], job["scope"], job["emb"], hit = _cache_lookup(item["question"], item.get("module"), skip_review)
+            if hit is not None:
+                out.write({"id": item["id"], "module": item.get("module"), **hit})
+                continue
+        jobs.append(job)
+    if not jobs:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        #Planner pass for the whole chunk
+        def _plan(job):
+            t0 = time.perf_counter()
+            job["plan"] = plan(job["item"]["question"])
+            job["subqs"] = job["plan"].get("sub_questions") or [job["item"]["question"]]
+            job["timings"]["plan_s"] = time.perf_counter() - t0
+        futs = {ex.submit(bind(_plan), job): job for job in jobs}
+        for fut in as_completed(futs):
+            if fut.exception() is not None:
+                job = futs[fut]
+                out.write(_error(job["item"], fut.exception()))
+                jobs.remove(job)
+        if not jobs:
+            return
+
+        #Every sub-question of the chunk: one embedding batch, one cross-encoder batch
+        t0 = time.perf_counter()
+        engine = _engine()
+        flat = [(job, sq) for job in jobs for sq in job["subqs"]]
+        try:
+            pools = engine.retrieve_and_rerank_many([sq for _, sq in flat], [j["item"].get("module") for j, _ in flat])
+        except Exception as e:
+            #Find out which questions break retrieval: retry them one by one, fail only those
+            print(f"[batch] chunk retrieval failed ({type(e).__name__}: {e}), retrying per question")
+            pools = []
+            for job in list(jobs):
+                try:
+                    pools += engine.retrieve_and_rerank_many(job["subqs"], job["item"].get("module"))
+                except Exception as e:
+                    out.write(_error(job["item"], e))
+                    jobs.remove(job)
+            if not jobs:
+                return
+            flat = [(job, sq) for job in jobs for sq in job["subqs"]]
+        dt = time.perf_counter() - t0
+        for job in jobs:
+            job["docs"] = []
+            job["timings"]["retrieve_rerank_batch_s"] = dt
+        for (job, _), docs in zip(flat, pools):
+            job["docs"].append(docs)
+
+        #Writer pass: generations pipelined against Ollama, `concurrency` in flight
+        futs = {ex.submit(bind(_write_answer), job, skip_review): job for job in jobs}
+        for fut in as_completed(futs):
+            job = futs[fut]
+            item = job["item"]
+            if fut.exception() is not None:
+                out.write(_error(item, fut.exception()))
+                continue
+            result = fut.result()
+            if use_cache:
+                job["cache"].put(item["question"], job["scope"], result, embedding=job["emb"])
+            out.write({"id": item["id"], "module": item.get("module"), **result})
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def run(
+    in_path: str,
+    out_path: str,
+    chunk_size: int = 64,
+    concurrency: Optional[int] = None,
+    skip_review: bool = False,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    concurrency = NUM_PARALLEL if concurrency is None else concurrency
+    #The process-wide scheduler is what actually bounds calls in flight
+    set_llm_concurrency(concurrency)
+    items = load_questions(in_path)
+    done = load_done(Path(out_path))
+    todo = [it for it in items if it["id"] not in done]
+    print(f"[batch] {len(items)} questions: {len(items) - len(todo)} already answered, {len(todo)} to go "
+          f"(chunk={chunk_size}, concurrency={concurrency})")
+    _engine().warmup()
+
+    out = ResultWriter(Path(out_path))
+    t_start = time.perf_counter()
+    try:
+        for chunk in _chunks(todo, chunk_size):
+            run_chunk(chunk, out, concurrency, skip_review=skip_review, use_cache=use_cache)
+            dt = time.perf_counter() - t_start
+            print(f"[batch] {out.written}/{len(todo)} written ({out.errors} errors), {out.written / dt:.2f} q/s")
+    finally:
+        out.close()
+    return {"questions": len(items), "skipped": len(items) - len(todo), "written": out.written,
+            "errors": out.errors, "elapsed_s": time.perf_counter() - t_start}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Answer a JSONL file of questions in bulk")
+    ap.add_argument("input", help='JSONL: {"question": ..., "module": optional, "id": optional}')
+    ap.add_argument("--out", required=True, help="results JSONL (appended; reruns resume)")
+    ap.add_argument("--chunk", type=int, default=64, help="questions planned / retrieved / reranked together")
+    ap.add_argument("--concurrency", type=int, default=None,
+                    help="LLM calls in flight; match the Ollama server's OLLAMA_NUM_PARALLEL "
+                         "(default: OLLAMA_NUM_PARALLEL)")
+    ap.add_argument("--skip-review", action="store_true")
+    ap.add_argument("--no-cache", action="store_true", help="bypass the answer cache")
+    ap.add_argument("--trace", action="store_true", help="print a per-stage latency breakdown")
+    args = ap.parse_args()
+    with span("batch") as root:
+        stats = run(args.input, args.out, args.chunk, args.concurrency, args.skip_review, not args.no_cache)
+    print(json.dumps(stats, indent=2))
+    if args.trace:
+        print(breakdown(root))
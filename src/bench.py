@@ -0,0 +1,401 @@
+import argparse, json, statistics, time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+BENCH_QUERIES = [
+    "Is text-and-data mining lawful for AI training in the EU?",
+    "What rights do data subjects have under EU law?",
+    "Who enforces these rules and what penalties exist?",
+]
+
+def _timeit(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t0) * 1000)
+    return {"mean_ms": statistics.mean(runs), "min_ms": min(runs), "max_ms": max(runs)}
+
+#Reranker: per-call CrossEncoder (old path) vs resident, batched, cached service
+def bench_rerank(sizes: List[int], repeat: int) -> List[Dict]:
+    from sentence_transformers import CrossEncoder
+    from .retrieval import get_engine
+    from .reranker import Reranker
+
+    engine = get_engine().warmup(rerank=False)
+    service = Reranker().warmup()
+    results = []
+    for n in sizes:
+        pools = [engine.search(q, k=n) for q in BENCH_QUERIES]
+
+        def old_path():
+            for q, docs in zip(BENCH_QUERIES, pools):
+                ce = CrossEncoder(settings.reranker_model)
+                ce.predict([(q, d.page_content) for d in docs])
+
+        def service_cold():
+            service.clear_cache()
+            service.score_many(BENCH_QUERIES, pools)
+
+        def service_warm():
+            service.score_many(BENCH_QUERIES, pools)
+
+        row = {"candidates": n, "queries": len(BENCH_QUERIES)}
+        row["per_call_model"] = _timeit(old_path, repeat)
+        row["service_batched"] = _timeit(service_cold, repeat)
+        row["service_cached"] = _timeit(service_warm, repeat)
+        results.append(row)
+        print(f"[bench] rerank n={n}: old={row['per_call_model']['mean_ms']:.0f}ms "
+              f"batched={row['service_batched']['mean_ms']:.0f}ms "
+              f"cached={row['service_cached']['mean_ms']:.1f}ms")
+    return results
+
+#Vector index: recall@k and latency of each ANN type against the exact flat baseline,
+#unfiltered and through the ID-selector path a module filter without a sub-index takes
+def _all_vectors(state):
+    """Every chunk vector, rebuilt from the (always flat) module sub-indexes."""
+    import numpy as np
+    d = state.index.d
+    mat = np.empty((state.index.ntotal, d), dtype=np.float32)
+    for sub, rows in state.modules.values():
+        mat[rows] = sub.reconstruct_n(0, sub.ntotal)
+    return mat
+
+def load_queries(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+def bench_index(types: List[str], k: int, queries: List[str], repeat: int) -> List[Dict]:
+    import faiss
+    import numpy as np
+    from .retrieval import get_engine
+    from .vector_index import build_index, describe, search_params
+
+    engine = get_engine().warmup(rerank=False)
+    vectors = _all_vectors(engine.state)
+    qv = np.concatenate([engine.embed_query(q) for q in queries])
+    print(f"[bench] index: {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+
+    flat = build_index(vectors, "flat")
+    _, truth = flat.search(qv, k)
+    allowed = np.arange(0, len(vectors), 3)
+    _, ftruth = flat.search(qv, k, params=search_params(flat, allowed))
+    results = []
+    for t in ["flat"] + [x for x in types if x != "flat"]:
+        t0 = time.perf_counter()
+        idx = flat if t == "flat" else build_index(vectors, t)
+        build_s = time.perf_counter() - t0
+
+        def run():
+            for i in range(len(qv)):
+                idx.search(qv[i:i + 1], k)
+        lat = _timeit(run, repeat)
+        _, got = idx.search(qv, k)
+        recall = float(np.mean([len(set(g) & set(tr)) / k for g, tr in zip(got.tolist(), truth.tolist())]))
+        _, fgot = idx.search(qv, k, params=search_params(idx, allowed))
+        if not np.isin(fgot[fgot >= 0], allowed).all():
+            raise AssertionError(f"{t}: filtered search returned rows outside the selector")
+        frecall = float(np.mean([len(set(g) & set(tr)) / k for g, tr in zip(fgot.tolist(), ftruth.tolist())]))
+        row = {
+            "type": t,
+            "index": describe(idx),
+            "build_s": build_s,
+            "bytes": int(len(faiss.serialize_index(idx))),
+            f"recall@{k}": recall,
+            f"filtered_recall@{k}": frecall,
+            "query_ms": lat["mean_ms"] / len(qv),
+        }
+        results.append(row)
+        print(f"[bench] {row['index']:<40} recall@{k}={recall:.3f} filtered={frecall:.3f} "
+              f"query={row['query_ms']:.3f}ms size={row['bytes']/1e6:.1f}MB build={build_s:.1f}s")
+    return results
+
+#Offline regression suite: labelled retrieval quality + latency, with Ollama replaced by src.mock_ollama
+LABELLED_QUERIES = "data/bench_queries.jsonl"
+
+def load_labelled(path: str) -> List[Dict]:
+    """{"question", "module"?, "relevant": [{"doc_id", "label"?}]} per line."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _hit(doc, target: Dict) -> bool:
+    meta = doc.metadata
+    if meta.get("doc_id") != target["doc_id"]:
+        return False
+    return "label" not in target or target["label"] in meta.get("labels", [])
+
+def _rank_metrics(docs: List, targets: List[Dict], k: int) -> Tuple[float, float]:
+    """(recall@k over the labelled targets, reciprocal rank of the first relevant doc)."""
+    found, rr = set(), 0.0
+    for rank, d in enumerate(docs[:k], 1):
+        hits = {i for i, t in enumerate(targets) if _hit(d, t)}
+        if hits and not rr:
+            rr = 1.0 / rank
+        found |= hits
+    return len(found) / len(targets), rr
+
+def _dist(ms: List[float]) -> Dict[str, float]:
+    ms = sorted(ms)
+    pick = lambda q: ms[min(len(ms) - 1, int(round(q * (len(ms) - 1))))]
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "mean_ms": statistics.mean(ms)}
+
+def _ms(fn: Callable[[], object]) -> Tuple[object, float]:
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000
+
+def bench_suite(queries_path: str, k: int, repeat: int, mock: bool, ttft_ms: float, token_ms: float,
+                load_ms: float = 0) -> Dict:
+    import hashlib, os
+    #No network: models must already be in the local HF cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    if mock:
+        from . import mock_ollama, ollama_client
+        _, url = mock_ollama.serve(ttft_ms=ttft_ms, token_ms=token_ms, load_ms=load_ms)
+        os.environ["OLLAMA_BASE"] = ollama_client.BASE = url
+    from .agentic import answer
+    from .ollama_client import model_stats, reset_model_stats
+    from .reranker import get_reranker
+    from .retrieval import RetrievalEngine, get_engine
+    from .tracing import recent_spans, summarize
+
+    queries = load_labelled(queries_path)
+    metrics: Dict[str, float] = {}
+
+    #Cold start: index files (fresh engine each time), then the two models once
+    loads = []
+    for _ in range(repeat):
+        state, dt = _ms(RetrievalEngine()._load_state)
+        state.store.close()
+        loads.append(dt)
+    metrics.update({f"index_load.{stat}": v for stat, v in _dist(loads).items()})
+    engine = get_engine()
+    _, metrics["model_load.embedder_ms"] = _ms(lambda: engine.warmup(rerank=False))
+    _, metrics["model_load.reranker_ms"] = _ms(get_reranker().warmup)
+
+    #Retrieval quality: dense only, the full candidate pipeline, and after reranking
+    top_n = settings.topk_reranked
+    quality: Dict[str, List[Tuple[float, float]]] = {"dense": [], "retrieve": [], "reranked": []}
+    retrieve_ms, rerank_ms, pairs = [], [], 0
+    per_query = []
+    for q in queries:
+        module, targets = q.get("module"), q["relevant"]
+        dense = engine.store.get(engine.search_rows(engine.embed_query(q["question"]), k, module)[0])
+        pool, dt = _ms(lambda: engine.retrieve(q["question"], module))
+        retrieve_ms.append(dt)
+        get_reranker().clear_cache()
+        ranked, dt = _ms(lambda: engine.rerank_many([q["question"]], [pool])[0])
+        rerank_ms.append(dt)
+        pairs += len(pool)
+        row = {"question": q["question"]}
+        for name, docs, cut in (("dense", dense, k), ("retrieve", pool, k), ("reranked", ranked, top_n)):
+            rec, rr = _rank_metrics(docs, targets, cut)
+            quality[name].append((rec, rr))
+            row[name] = {"recall": rec, "rr": rr}
+        per_query.append(row)
+    for name, vals in quality.items():
+        cut = top_n if name == "reranked" else k
+        metrics[f"retrieval.{name}.recall@{cut}"] = statistics.mean(r for r, _ in vals)
+        metrics[f"retrieval.{name}.mrr"] = statistics.mean(rr for _, rr in vals)
+    metrics.update({f"retrieve.{stat}": v for stat, v in _dist(retrieve_ms).items()})
+    metrics.update({f"rerank.{stat}": v for stat, v in _dist(rerank_ms).items()})
+    metrics["rerank.pairs_per_s"] = pairs / (sum(rerank_ms) / 1000) if sum(rerank_ms) else 0.0
+
+    #End to end through the agentic pipeline (answer cache off, LLM = mock or real Ollama)
+    since = time.time()
+    reset_model_stats()
+    e2e_ms = []
+    for q in queries:
+        get_reranker().clear_cache()
+        _, dt = _ms(lambda: answer(q["question"], module=q.get("module"), use_cache=False))
+        e2e_ms.append(dt)
+    metrics.update({f"e2e.{stat}": v for stat, v in _dist(e2e_ms).items()})
+    stages = summarize(s for s in recent_spans() if s.start >= since)
+    #Weight loads (planner/writer swaps) vs time spent actually generating
+    llm = model_stats()["total"]
+    metrics["llm.loads"] = llm["loads"]
+    metrics["llm.load_ms"] = llm["load_s"] * 1000
+    metrics["llm.gen_ms"] = llm["gen_s"] * 1000
+    metrics["llm.load_share"] = llm["load_share"]
+    if "synthesize" in stages:
+        #Writer-prompt context per sub-question, as packed vs pasted verbatim
+        metrics["ctx_tokens.mean"] = stages["synthesize"]["mean_ctx_tokens"]
+        metrics["ctx_tokens_unpacked.mean"] = stages["synthesize"]["mean_ctx_tokens_unpacked"]
+
+    with open(queries_path, "rb") as f:
+        qhash = hashlib.sha1(f.read()).hexdigest()[:12]
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "index_version": engine.version,
+        "index_type": settings.index_type,
+        "chunks": len(engine.store),
+        "embedding_model": settings.embedding_model,
+        "reranker_model": settings.reranker_model,
+        "queries": queries_path,
+        "queries_sha1": qhash,
+        "n_queries": len(queries),
+        "llm": "mock" if mock else "ollama",
+        "k": k,
+    }
+    if mock:
+        meta["mock_fingerprint"] = mock_ollama.fingerprint()
+    for name, v in sorted(metrics.items()):
+        print(f"[bench] {name:<34} {v:10.3f}")
+    return {"meta": meta, "metrics": metrics, "stages": stages, "per_query": per_query}
+
+#Startup: each entry point in a fresh interpreter under `python -X importtime`
+STARTUP_TARGETS = {
+    #What the Streamlit app imports before the first question (Learn / Progress tabs)
+    "app_learn": ["-c", "import src.config, src.manifest, src.client, src.progress_store"],
+    "agentic_help": ["-m", "src.agentic", "--help"],
+    "ask_help": ["-m", "src.ask", "--help"],
+    "batch_help": ["-m", "src.batch", "--help"],
+    "retrieval_help": ["-m", "src.retrieval", "--help"],
+}
+#None of these should load before a model is actually needed
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "langchain_core", "langchain_huggingface",
+                 "langchain_community", "faiss", "ragas")
+
+def _importtime(argv: List[str]) -> Dict:
+    """Wall time, summed top-level import time, heaviest top-level imports and heavy modules loaded."""
+    import subprocess, sys
+    from pathlib import Path
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", *argv], capture_output=True, text=True,
+                          cwd=Path(__file__).resolve().parent.parent)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    top, loaded = [], set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        #Nesting is shown by indentation; one space = imported by the entry point itself
+        if len(name) - len(name.lstrip()) == 1:
+            top.append((name.strip(), int(cumulative) / 1000))
+    errors = [l for l in proc.stderr.splitlines() if l and not l.startswith("import time:")]
+    return {
+        "ok": proc.returncode == 0,
+        "wall_ms": wall_ms,
+        "import_ms": sum(ms for _, ms in top),
+        "top": sorted(top, key=lambda t: -t[1])[:8],
+        "heavy": [m for m in HEAVY_MODULES if m in loaded],
+        **({"error": errors[-1]} if proc.returncode != 0 and errors else {}),
+    }
+
+def bench_startup(targets: List[str], repeat: int) -> Dict:
+    """Best of `repeat` cold interpreter starts per target (the first run also warms the OS file cache)."""
+    metrics: Dict[str, float] = {}
+    details = {}
+    for name in targets:
+        runs = [_importtime(STARTUP_TARGETS[name]) for _ in range(max(1, repeat))]
+        best = min(runs, key=lambda r: r["wall_ms"])
+        details[name] = best
+        metrics[f"startup.{name}.wall_ms"] = best["wall_ms"]
+        metrics[f"startup.{name}.import_ms"] = best["import_ms"]
+        metrics[f"startup.{name}.heavy_modules"] = len(best["heavy"])
+        status = "ok" if best["ok"] else f"FAILED ({best.get('error', '')})"
+        print(f"[bench] startup {name:<16} wall {best['wall_ms']:8.1f} ms  imports {best['import_ms']:8.1f} ms  "
+              f"heavy={','.join(best['heavy']) or '-'}  {status}")
+    meta = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": repeat}
+    return {"meta": meta, "metrics": metrics, "startup": details}
+
+def _higher_is_better(metric: str) -> Optional[bool]:
+    if "recall" in metric or metric.endswith(".mrr") or metric.endswith("_per_s"):
+        return True
+    if metric.endswith("_ms") or metric.endswith(".heavy_modules"):
+        return False
+    return None
+
+def compare(report: Dict, baseline: Dict, latency_tol: float, quality_tol: float) -> List[Dict]:
+    """
+    Metric-by-metric diff against a baseline report. Quality regresses when it
+    drops by more than `quality_tol` (absolute); latency when it grows by more
+    than `latency_tol` (relative).
+    """
+    rows = []
+    for name, new in sorted(report["metrics"].items()):
+        old = baseline.get("metrics", {}).get(name)
+        better = _higher_is_better(name)
+        if old is None or better is None:
+            continue
+        if better:
+            tol = quality_tol if name.startswith("retrieval.") else old * latency_tol
+            worse = new < old - tol
+        elif name.endswith(".heavy_modules"):
+            worse = new > old
+        else:
+            worse = new > old * (1 + latency_tol)
+        rows.append({"metric": name, "baseline": old, "current": new, "delta": new - old,
+                     "status": "REGRESSION" if worse else "ok"})
+    for key in ("index_version", "index_type", "embedding_model", "reranker_model", "queries_sha1", "llm"):
+        if baseline.get("meta", {}).get(key) != report["meta"].get(key):
+            print(f"[bench] note: {key} differs from baseline "
+                  f"({baseline.get('meta', {}).get(key)} -> {report['meta'].get(key)})")
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="EU Navigator micro-benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rr = sub.add_parser("rerank", help="cross-encoder reranking latency")
+    rr.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    rr.add_argument("--repeat", type=int, default=3)
+    rr.add_argument("--out", help="optional JSON report path")
+
+    ix = sub.add_parser("index", help="recall@k vs latency of ANN index types against flat")
+    ix.add_argument("--types", nargs="+", default=["hnsw", "ivfsq8", "ivfpq"])
+    ix.add_argument("--k", type=int, default=settings.topk_retriever)
+    ix.add_argument("--queries", help="JSONL with a 'question' field per line (default: built-in set)")
+    ix.add_argument("--repeat", type=int, default=5)
+    ix.add_argument("--out", help="optional JSON report path")
+
+    su = sub.add_parser("suite", help="offline retrieval quality + latency regression suite")
+    su.add_argument("--queries", default=LABELLED_QUERIES, help="labelled JSONL (question -> doc_id/label)")
+    su.add_argument("--k", type=int, default=settings.topk_retriever)
+    su.add_argument("--repeat", type=int, default=3, help="cold index loads to time")
+    su.add_argument("--ollama", action="store_true", help="use the real Ollama instead of the mock")
+    su.add_argument("--ttft-ms", type=float, default=50, help="mock time to first token")
+    su.add_argument("--token-ms", type=float, default=2, help="mock per-token delay")
+    su.add_argument("--load-ms", type=float, default=0, help="mock weight load per model switch")
+    su.add_argument("--baseline", help="earlier suite report to compare against")
+    su.add_argument("--latency-tol", type=float, default=0.2, help="allowed relative latency growth")
+    su.add_argument("--quality-tol", type=float, default=0.01, help="allowed absolute recall/MRR drop")
+    su.add_argument("--out", help="optional JSON report path")
+
+    st = sub.add_parser("startup", help="cold import / CLI start time per entry point (python -X importtime)")
+    st.add_argument("--targets", nargs="+", choices=sorted(STARTUP_TARGETS), default=list(STARTUP_TARGETS))
+    st.add_argument("--repeat", type=int, default=3)
+    st.add_argument("--baseline", help="earlier startup report to compare against")
+    st.add_argument("--latency-tol", type=float, default=0.2, help="allowed relative start time growth")
+    st.add_argument("--out", help="optional JSON report path")
+
+    args = ap.parse_args()
+    if args.cmd == "rerank":
+        report = {"rerank": bench_rerank(args.sizes, args.repeat)}
+    elif args.cmd == "index":
+        queries = load_queries(args.queries) if args.queries else BENCH_QUERIES
+        report = {"index": bench_index(args.types, args.k, queries, args.repeat)}
+    elif args.cmd == "suite":
+        report = bench_suite(args.queries, args.k, args.repeat, not args.ollama, args.ttft_ms, args.token_ms, args.load_ms)
+    elif args.cmd == "startup":
+        report = bench_startup(args.targets, args.repeat)
+    if args.cmd in ("suite", "startup") and args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            rows = compare(report, json.load(f), args.latency_tol, getattr(args, "quality_tol", 0.0))
+        report["comparison"] = rows
+        for r in rows:
+            print(f"[bench] {r['status']:<10} {r['metric']:<34} {r['baseline']:10.3f} -> {r['current']:10.3f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[bench] report → {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+    if any(r["status"] == "REGRESSION" for r in report.get("comparison", [])):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import mmap, sqlite3, threading
+from array import array
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+#Index directory layout; row i of the chunk store is vector i of index.faiss
+INDEX_FILE = "index.faiss"
+MODULES_DIR = "modules"          #<module>.faiss + <module>.rows.npy (local -> global row)
+TEXT_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+META_FILE = "chunks.sqlite"
+
+SCHEMA = """
+CREATE TABLE docs (
+    doc_idx  INTEGER PRIMARY KEY,
+    doc_id   TEXT UNIQUE NOT NULL,
+    title    TEXT,
+    module   TEXT,
+    txt_path TEXT,
+    pdf_path TEXT
+);
+CREATE TABLE chunks (
+    row      INTEGER PRIMARY KEY,
+    chunk_id TEXT UNIQUE NOT NULL,
+    doc_idx  INTEGER NOT NULL,
+    s_idx    INTEGER NOT NULL,
+    c_idx    INTEGER NOT NULL,
+    section  TEXT,
+    labels   TEXT               -- comma-separated structural labels (article_17,chapter_iii)
+);
+CREATE INDEX chunks_doc ON chunks(doc_idx);
+CREATE INDEX docs_module ON docs(module);
+"""
+
+DOC_FIELDS = ("doc_id", "title", "module", "txt_path", "pdf_path")
+
+class ChunkStoreWriter:
+    """Append chunks in index order: text goes to one UTF-8 blob, metadata to SQLite."""
+
+    def __init__(self, root: Path, flush_every: int = 1024):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        for name in (TEXT_FILE, OFFSETS_FILE, META_FILE):
+            (self.root / name).unlink(missing_ok=True)
+        self._blob = open(self.root / TEXT_FILE, "wb")
+        self._offsets = array("q", [0])
+        self._db = sqlite3.connect(str(self.root / META_FILE))
+        self._db.executescript(SCHEMA)
+        self._doc_idx: Dict[str, int] = {}
+        self._pending: List[tuple] = []
+        self._flush_every = flush_every
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def add(self, chunk_id: str, text: str, metadata: Dict[str, Any]) -> int:
+        did = metadata["doc_id"]
+        if did not in self._doc_idx:
+            self._doc_idx[did] = len(self._doc_idx)
+            self._db.execute(
+                "INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?)",
+                (self._doc_idx[did], *(metadata.get(k, "") for k in DOC_FIELDS)),
+            )
+        row = len(self)
+        data = text.encode("utf-8")
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        s_idx, c_idx = metadata.get("chunk_index", (0, 0))
+        labels = ",".join(metadata.get("labels", []))
+        self._pending.append((row, chunk_id, self._doc_idx[did], s_idx, c_idx, metadata.get("section", ""), labels))
+        if len(self._pending) >= self._flush_every:
+            self._flush()
+        return row
+
+    def _flush(self) -> None:
+        self._db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def close(self) -> None:
+        self._flush()
+        self._db.commit()
+        self._db.close()
+        self._blob.close()
+        np.save(self.root / OFFSETS_FILE, np.frombuffer(self._offsets, dtype=np.int64))
+
+class ChunkStore:
+    """
+    Read side: the text blob and offsets are memory-mapped, metadata stays in
+    SQLite, and only the requested rows are turned into Documents.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        if not (self.root / META_FILE).exists():
+            raise FileNotFoundError(
+                f"No chunk store in {self.root}. Rebuild the index with `python -m src.ingest --full`."
+            )
+        self._offsets = np.load(self.root / OFFSETS_FILE, mmap_mode="r")
+        self._f = open(self.root / TEXT_FILE, "rb")
+        size = self._f.seek(0, 2)
+        self._blob = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._db = sqlite3.connect(f"file:{self.root / META_FILE}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def close(self) -> None:
+        self._db.close()
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._f.close()
+
+    def text(self, row: int) -> str:
+        return self._blob[int(self._offsets[row]):int(self._offsets[row + 1])].decode("utf-8")
+
+    def _query(self, sql: str, args: Sequence = ()) -> List[tuple]:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def get(self, rows: Sequence[int]) -> List["Document"]:
+        """Documents for `rows`, in the order given."""
+        from langchain_core.documents import Document
+        rows = [int(r) for r in rows]
+        if not rows:
+            return []
+        marks = ",".join("?" * len(rows))
+        found = {
+            r[0]: r for r in self._query(
+                "SELECT c.row, c.chunk_id, c.s_idx, c.c_idx, c.section, c.labels, "
+                "d.doc_id, d.title, d.module, d.txt_path, d.pdf_path "
+                f"FROM chunks c JOIN docs d USING (doc_idx) WHERE c.row IN ({marks})",
+                rows,
+            )
+        }
+        out = []
+        for r in rows:
+            _, _, s_idx, c_idx, section, labels, *doc = found[r]
+            meta = dict(zip(DOC_FIELDS, doc))
+            meta.update({
+                "chunk_index": (s_idx, c_idx),
+                "section": section or "",
+                "labels": labels.split(",") if labels else [],
+                "row": r,
+            })
+            out.append(Document(page_content=self.text(r), metadata=meta))
+        return out
+
+    def chunk_rows(self) -> Dict[str, int]:
+        return dict(self._query("SELECT chunk_id, row FROM chunks"))
+
+    def module_rows(self, module: str) -> np.ndarray:
+        rows = self._query(
+            "SELECT c.row FROM chunks c JOIN docs d USING (doc_idx) WHERE d.module = ? ORDER BY c.row",
+            (module,),
+        )
+        return np.asarray([r[0] for r in rows], dtype=np.int64)
+
+    def module_docs(self, module: str) -> List[str]:
+        return [r[0] for r in self._query("SELECT doc_id FROM docs WHERE module = ?", (module,))]
+
+    def modules(self) -> List[str]:
+        return [r[0] for r in self._query("SELECT DISTINCT module FROM docs ORDER BY module")]
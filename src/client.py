@@ -0,0 +1,55 @@
+import json, os
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+#e.g. http://127.0.0.1:8008 (python -m src.server); unset = run the pipeline in-process
+SERVER = os.getenv("NAVIGATOR_SERVER", "")
+
+TIMEOUT = float(os.getenv("NAVIGATOR_TIMEOUT", "900"))
+
+class NavigatorClient:
+    """Thin client for src.server; responses mirror the in-process functions."""
+
+    def __init__(self, base_url: str):
+        self.base = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def _post(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        r = self.session.post(f"{self.base}{path}", json=body, timeout=TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    def health(self) -> Dict[str, Any]:
+        r = self.session.get(f"{self.base}/health", timeout=TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    def retrieve(self, question: str, module: Optional[str] = None, rerank: bool = True) -> Dict[str, Any]:
+        return self._post("/retrieve", {"question": question, "module": module, "rerank": rerank})
+
+    def ask(self, question: str, module: Optional[str] = None) -> Dict[str, Any]:
+        return self._post("/ask", {"question": question, "module": module})
+
+    def answer(self, question: str, module: Optional[str] = None, skip_review: bool = False,
+               concurrency: Optional[int] = None, use_cache: bool = True) -> Dict[str, Any]:
+        return self._post("/answer", {
+            "question": question, "module": module, "skip_review": skip_review,
+            "concurrency": concurrency, "use_cache": use_cache,
+        })
+
+    def answer_stream(self, question: str, module: Optional[str] = None, skip_review: bool = False,
+                      use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+        """Same events as agentic.answer_stream(), read from the server's NDJSON stream."""
+        body = {"question": question, "module": module, "skip_review": skip_review,
+                "use_cache": use_cache, "stream": True}
+        with self.session.post(f"{self.base}/answer", json=body, stream=True, timeout=TIMEOUT) as r:
+            r.raise_for_status()
+            for line in r.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
+
+def get_client(base_url: Optional[str] = None) -> Optional[NavigatorClient]:
+    """A client when a server URL is given or NAVIGATOR_SERVER is set, else None."""
+    url = base_url or SERVER
+    return NavigatorClient(url) if url else None
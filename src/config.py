@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 from pydantic import BaseModel
 
 class Settings(BaseModel):
@@ -10,6 +11,46 @@ class Settings(BaseModel):
     reranker_model: str = "BAAI/bge-reranker-v2-m3"  #Cross-encoder
     topk_retriever: int = 10
     topk_reranked: int = 3
+    adaptive_depth: bool = True        #Widen the candidate pool to topk_retriever_max when dense scores are flat
+    topk_retriever_max: int = 30
+    adaptive_flat_gap: float = 0.04    #cos(top-1) - cos(top-k) below this counts as flat
+    rerank_stage_size: int = 8         #Cross-encoder scores each pool in stages of this many candidates
+    rerank_exit_score: Optional[float] = 0.5  #Stop once top-n (per-doc cap applied) all score >= this; None = score all
+    context_budget_tokens: int = 2500  #Writer-prompt context, measured with context_tokenizer; 0 = unlimited
+    context_min_block_tokens: int = 64 #A trimmed block shorter than this is dropped instead
+    context_tokenizer: str = "unsloth/Meta-Llama-3.1-8B-Instruct"  #HF tokenizer matching WRITER_MODEL; "" = chars/4
+    hybrid_retrieval: bool = True      #Fuse BM25 hits with dense hits (reciprocal-rank fusion)
+    topk_lexical: int = 10
+    rrf_k: int = 60
+    structural_lookup: bool = True     #"GDPR Article 17" -> chunks via the (doc, article) map
+    structural_skip_dense: bool = False  #True: answer direct hits without dense search at all
+    bm25_k1: float = 1.2
+    bm25_b: float = 0.75
+    reranker_batch_size: int = 32
+    reranker_max_length: int = 512     #Tokens per (query, chunk) pair
+    reranker_threads: int = 0          #torch intra-op threads, 0 = torch default
+    reranker_cache_size: int = 4096    #LRU entries of (query, chunk_id, text digest) -> score
+    index_type: str = "flat"           #flat | hnsw | ivfpq | ivfsq8 (module sub-indexes stay flat)
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 0                 #0 = ~4*sqrt(n), capped so each list gets >= 39 training points
+    ivf_nprobe: int = 16
+    pq_m: int = 64                     #Sub-quantizers; must divide 1024 (bge-m3 dim)
+    pq_nbits: int = 8
+    ingest_workers: int = 0            #Split/chunk processes, 0 = CPU count
+    ingest_batch_size: int = 256       #Chunks per embed -> FAISS add batch
+    embed_cache_enabled: bool = True
+    embed_cache_dir: Path = Path("cache/embeddings")   #memmapped float32 vectors + key index
+    answer_cache_path: Path = Path("cache/answers.sqlite")
+    answer_cache_ttl_s: int = 7 * 24 * 3600
+    answer_cache_max_entries: int = 2000
+    answer_cache_semantic_threshold: Optional[float] = None  #e.g. 0.95 cosine; None = exact match only
+    progress_db_path: Path = Path("user_progress.sqlite")   #Learn-tab done flags + notes
+    progress_legacy_json: Path = Path("user_progress.json")  #Imported once into progress_db_path
+    server_batch_max: int = 32         #Queries per micro-batch (one embed pass + one rerank pass)
+    server_batch_wait_ms: float = 5.0  #How long the first query of a batch waits for company
+    server_llm_concurrency: int = 0    #In-flight Ollama generations for the whole server, 0 = OLLAMA_NUM_PARALLEL
 
 settings = Settings()
 
@@ -0,0 +1,133 @@
+import functools, logging, re, threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+#Writer tokenizer, loaded once; None = not available, fall back to a chars/4 estimate
+_TOKENIZER: Any = None
+_TOKENIZER_LOADED = False
+_TOKENIZER_LOCK = threading.Lock()
+
+def _tokenizer():
+    global _TOKENIZER, _TOKENIZER_LOADED
+    if not _TOKENIZER_LOADED:
+        with _TOKENIZER_LOCK:
+            if not _TOKENIZER_LOADED:
+                if settings.context_tokenizer:
+                    try:
+                        from transformers import AutoTokenizer
+                        _TOKENIZER = AutoTokenizer.from_pretrained(settings.context_tokenizer)
+                    except Exception as e:
+                        log.warning("tokenizer %s unavailable (%s); estimating tokens as chars/4",
+                                    settings.context_tokenizer, e)
+                _TOKENIZER_LOADED = True
+    return _TOKENIZER
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    tok = _tokenizer()
+    if tok is None:
+        return (len(text) + 3) // 4
+    return len(tok.encode(text, add_special_tokens=False))
+
+def _citation(meta: Dict[str, Any]) -> str:
+    section = meta.get("section", "")
+    return f"[{meta['doc_id']}: {section}]" if section else f"[{meta['doc_id']}]"
+
+def _position(d: Any) -> Optional[Tuple[str, int, int]]:
+    idx = d.metadata.get("chunk_index")
+    if not isinstance(idx, (list, tuple)) or len(idx) != 2:
+        return None
+    return d.metadata["doc_id"], int(idx[0]), int(idx[1])
+
+def _join(a: str, b: str) -> str:
+    """
+    a + b with the splitter's chunk_overlap (b's head repeating a's tail)
+    removed. Only an overlap of at least chunk_overlap/2 chars that starts and
+    ends on word boundaries counts; shorter matches ("... personal data" +
+    "data subjects ...") are coincidence and both copies are kept.
+    """
+    min_k = max(1, settings.chunk_overlap // 2)
+    for k in range(min(len(a), len(b), 2 * settings.chunk_overlap), min_k - 1, -1):
+        if not a.endswith(b[:k]):
+            continue
+        starts_word = k == len(a) or not a[-k - 1].isalnum() or not b[0].isalnum()
+        ends_word = k == len(b) or not b[k].isalnum() or not b[k - 1].isalnum()
+        if starts_word and ends_word:
+            return a + b[k:]
+    return a + "\n" + b
+
+def merge_chunks(docs: Sequence[Any]) -> List[Tuple[str, str]]:
+    """
+    (citation, text) blocks in rerank order. Chunks that are neighbours in the
+    same section (consecutive chunk_index, same citation) become one block
+    placed at its best-ranked chunk; duplicated overlap is stripped.
+    """
+    groups: Dict[Tuple[Any, int, str], List[Tuple[int, str]]] = {}
+    order: List[Tuple[Any, int, str]] = []
+    for d in docs:
+        pos, cite = _position(d), _citation(d.metadata)
+        #Chunks without a position never merge
+        key = (pos[0], pos[1], cite) if pos is not None else (id(d), -1, cite)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        c_idx = pos[2] if pos is not None else 0
+        if all(c != c_idx for c, _ in groups[key]):
+            groups[key].append((c_idx, d.page_content.strip()))
+
+    blocks: List[Tuple[str, str]] = []
+    for key in order:
+        parts, cite = sorted(groups[key]), key[2]
+        run_text, prev = parts[0][1], parts[0][0]
+        for c_idx, text in parts[1:]:
+            if c_idx == prev + 1:
+                run_text = _join(run_text, text)
+            else:
+                blocks.append((cite, run_text))
+                run_text = text
+            prev = c_idx
+        blocks.append((cite, run_text))
+    return blocks
+
+def _trim(text: str, tokens: int) -> str:
+    """Longest sentence-aligned prefix of `text` within `tokens`."""
+    cut = text[: max(1, tokens * len(text) // max(1, count_tokens(text)))]
+    while cut and count_tokens(cut) > tokens:
+        cut = cut[: int(len(cut) * 0.9)]
+    m = re.search(r"^.*[.;:](?=\s)", cut, re.DOTALL)
+    return (m.group(0) if m else cut).rstrip() + " …"
+
+def _block_cost(i: int, cite: str, text: str) -> int:
+    return count_tokens(f"[{i}] CITATION: {cite}") + count_tokens(text) + 2
+
+def pack_context(docs: Sequence[Any], budget: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+    """
+    Context string for the writer prompt plus token stats: `ctx_tokens` as
+    packed, `ctx_tokens_unpacked` for the chunks pasted verbatim, and how many
+    blocks made it in. Blocks past the budget are trimmed, then dropped.
+    """
+    budget = settings.context_budget_tokens if budget is None else budget
+    lines, used, packed = [], 0, 0
+    for i, (cite, text) in enumerate(merge_chunks(docs), 1):
+        cost = _block_cost(i, cite, text)
+        if budget > 0 and used + cost > budget:
+            room = budget - used - (cost - count_tokens(text))
+            if room < settings.context_min_block_tokens:
+                break
+            text = _trim(text, room - 2)  #room for the ellipsis
+            cost = _block_cost(i, cite, text)
+        lines += [f"[{i}] CITATION: {cite}", text, ""]
+        used += cost
+        packed += 1
+    stats = {
+        "ctx_tokens": used,
+        #What the old one-chunk-per-entry packing would have sent
+        "ctx_tokens_unpacked": sum(
+            _block_cost(i, _citation(d.metadata), d.page_content.strip()[:4000]) for i, d in enumerate(docs, 1)
+        ),
+        "ctx_blocks": packed,
+    }
+    return "\n".join(lines), stats
@@ -0,0 +1,211 @@
+import hashlib, json, os, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  #Windows: in-process locking only
+    fcntl = None
+
+def embed_key(model_name: str, normalize: bool, text: str) -> str:
+    return hashlib.sha1(f"{model_name}|{int(normalize)}|{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Disk-backed vector cache: vectors.f32 is an append-only float32 matrix read
+    through np.memmap, keys.tsv maps key -> row. Rows past the end of the
+    matrix (torn write) are ignored on load. Appends hold an exclusive flock on
+    `.lock` and number new rows from the vector file's size at that moment, so
+    several processes (server, app, ingest, batch) can share one directory.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or settings.embed_cache_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._vec_path = self.root / "vectors.f32"
+        self._key_path = self.root / "keys.tsv"
+        self._meta_path = self.root / "meta.json"
+        self._lock_path = self.root / ".lock"
+        self._lock = threading.Lock()
+        self._keys_read = 0  #Bytes of keys.tsv already folded into _index
+        self._index: Dict[str, int] = {}
+        self._mm: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.dim is None and self._meta_path.exists():
+            self.dim = json.loads(self._meta_path.read_text())["dim"]
+        if self.dim and self._vec_path.exists():
+            self.rows = self._vec_path.stat().st_size // (4 * self.dim)
+        if self._key_path.exists():
+            #Only the lines appended since the last read (by this or another process)
+            with open(self._key_path, "rb") as f:
+                f.seek(self._keys_read)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    self._keys_read += len(raw)
+                    k, _, r = raw.decode("utf-8").rstrip("\n").partition("\t")
+                    if r and int(r) < self.rows:
+                        self._index[k] = int(r)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as lf:
+            if fcntl is not None:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _matrix(self) -> np.memmap:
+        if self._mm is None or self._mm.shape[0] != self.rows:
+            self._mm = np.memmap(self._vec_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return self._mm
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            rows = [self._index.get(k) for k in keys]
+            if not self.rows or all(r is None for r in rows):
+                return [None] * len(keys)
+            mm = self._matrix()
+            return [None if r is None else np.array(mm[r]) for r in rows]
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not keys:
+            return
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            #Pick up dim, rows and keys written by other processes since we last looked
+            self._load()
+            if self.dim is None:
+                self.dim = int(arr.shape[1])
+                self._meta_path.write_text(json.dumps({"dim": self.dim}))
+            elif arr.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {arr.shape[1]} != cache dim {self.dim} ({self.root})")
+            fresh = [(k, v) for k, v in zip(keys, arr) if k not in self._index]
+            if not fresh:
+                return
+            row_bytes = 4 * self.dim
+            #Vectors first, then keys: a crash in between only leaves unreferenced rows
+            with open(self._vec_path, "ab") as f:
+                end = f.seek(0, os.SEEK_END)
+                if end % row_bytes:
+                    #Torn row from a crashed writer: drop it so rows stay aligned
+                    f.truncate(end - end % row_bytes)
+                    end = f.seek(0, os.SEEK_END)
+                start = end // row_bytes
+                f.write(np.stack([v for _, v in fresh]).tobytes())
+            with open(self._key_path, "ab") as f:
+                #Cut a torn last key line (crashed writer) so it can't fuse with ours
+                f.truncate(self._keys_read)
+                f.write("".join(f"{k}\t{start + i}\n" for i, (k, _) in enumerate(fresh)).encode("utf-8"))
+            for i, (k, _) in enumerate(fresh):
+                self._index[k] = start + i
+            self.rows = start + len(fresh)
+            self._keys_read = self._key_path.stat().st_size
+
+_CACHES: Dict[Path, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+def get_embedding_cache(root: Optional[Path] = None) -> EmbeddingCache:
+    """One EmbeddingCache per directory per process; other processes are handled by the file lock."""
+    root = Path(root or settings.embed_cache_dir).resolve()
+    with _CACHES_LOCK:
+        if root not in _CACHES:
+            _CACHES[root] = EmbeddingCache(root)
+        return _CACHES[root]
+
+class _CachedEmbeddings:
+    """
+    LangChain Embeddings wrapper that consults EmbeddingCache before the model.
+    The wrapped model is only built (via `factory`) on the first cache miss.
+    """
+
+    def __init__(self, factory: Callable[[], "Embeddings"], model_name: str, normalize: bool = True,
+                 cache: Optional[EmbeddingCache] = None):
+        self._factory = factory
+        self._base: Optional["Embeddings"] = None
+        self._base_lock = threading.Lock()
+        self.model_name = model_name
+        self.normalize = normalize
+        self.cache = cache or get_embedding_cache()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def base(self) -> "Embeddings":
+        if self._base is None:
+            with self._base_lock:
+                if self._base is None:
+                    self._base = self._factory()
+        return self._base
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embed_key(self.model_name, self.normalize, t) for t in texts]
+        found = self.cache.get_many(keys)
+        todo = [i for i, v in enumerate(found) if v is None]
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        if todo:
+            fresh = self.base.embed_documents([texts[i] for i in todo])
+            self.cache.put_many([keys[i] for i in todo], fresh)
+            for i, v in zip(todo, fresh):
+                found[i] = np.asarray(v, dtype=np.float32)
+        return [v.tolist() for v in found]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = embed_key(self.model_name, self.normalize, text)
+        v = self.cache.get_many([key])[0]
+        if v is not None:
+            self.hits += 1
+            return v.tolist()
+        self.misses += 1
+        fresh = self.base.embed_query(text)
+        self.cache.put_many([key], [fresh])
+        return fresh
+
+_CACHED_CLS: Optional[type] = None
+
+def _cached_embeddings_cls() -> type:
+    """CachedEmbeddings, built on first use so importing this module does not load langchain_core."""
+    global _CACHED_CLS
+    if _CACHED_CLS is None:
+        from langchain_core.embeddings import Embeddings
+
+        class CachedEmbeddings(_CachedEmbeddings, Embeddings):
+            __doc__ = _CachedEmbeddings.__doc__
+        _CACHED_CLS = CachedEmbeddings
+    return _CACHED_CLS
+
+def __getattr__(name: str) -> Any:
+    if name == "CachedEmbeddings":
+        return _cached_embeddings_cls()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def cached_hf_embeddings(model_name: Optional[str] = None, normalize: bool = True) -> "Embeddings":
+    """bge-m3 (by default) behind the disk cache; plain HF embeddings if the cache is disabled."""
+    model_name = model_name or settings.embedding_model
+
+    def factory() -> "Embeddings":
+        #langchain_huggingface loads sentence_transformers/torch; only on the first cache miss
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"normalize_embeddings": normalize})
+    if not settings.embed_cache_enabled:
+        return factory()
+    return _cached_embeddings_cls()(factory, model_name, normalize)
@@ -1,16 +1,19 @@
-
 import os
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 
-import re, numpy as np, pandas as pd
-from typing import List, Dict
+import copy, hashlib, json, re, threading, numpy as np, pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 from datasets import Dataset
 from ragas import evaluate
 from ragas.metrics import answer_relevancy, faithfulness
-from langchain_openai import ChatOpenAI
-from langchain_huggingface import HuggingFaceEmbeddings
+from ragas.run_config import RunConfig
+
+from src.retrieval import get_engine
 
-from src.retrieval import retrieve_and_rerank
+OUT_CSV = Path("eval_ragas.csv")
+METRICS = {m.name: m for m in (answer_relevancy, faithfulness)}
 
 SEED = [
     ("Is text-and-data mining lawful for AI training in the EU?", None),
@@ -51,9 +54,11 @@ def cosine(a: List[float], b: List[float]) -> float:
     return float(np.dot(va, vb) / (na * nb))
 
 def build_rows(seed):
+    #All questions retrieved and reranked together (one embed pass, one cross-encoder pass)
+    questions = [q for q, _ in seed]
+    pools = get_engine().retrieve_and_rerank_many(questions, [m for _, m in seed])
     rows: List[Dict] = []
-    for q, module in seed:
-        docs = retrieve_and_rerank(q, module_filter=module)
+    for q, docs in zip(questions, pools):
         ctx = [d.page_content for d in docs]
         if not ctx:
             print(f"[eval] SKIP (no contexts): {q}")
@@ -65,65 +70,154 @@ def build_rows(seed):
         rows.append({"question": q, "answer": ans, "contexts": ctx})
     return rows
 
-def main():
+def load_seed(path: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """SEED, or (question, module) pairs from a JSONL file such as data/bench_queries.jsonl."""
+    if not path:
+        return SEED
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [(it["question"], it.get("module")) for it in items]
+
+#Judge backends: OpenAI (the original setup) or a local Ollama model, no network needed
+def make_judge(name: str, model: Optional[str] = None):
+    if name == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model or "gpt-4o-mini", temperature=0), f"openai:{model or 'gpt-4o-mini'}"
+    if name == "ollama":
+        from langchain_community.chat_models import ChatOllama
+        from src.ollama_client import BASE
+        model = model or os.getenv("JUDGE_MODEL", "llama3.1:8b")
+        return ChatOllama(model=model, base_url=BASE, temperature=0), f"ollama:{model}"
+    raise ValueError(f"Unknown judge {name!r}; expected openai or ollama")
+
+class ScoreCache:
+    """
+    (judge, metric, question, answer, contexts) -> score, checkpointed as JSONL
+    next to the CSV. Each finished batch is appended, so an interrupted run
+    resumes where it stopped and reruns only score changed rows.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._scores: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        self._scores[rec["key"]] = rec["score"]
+
+    @staticmethod
+    def key(judge: str, metric: str, row: Dict) -> str:
+        blob = json.dumps([judge, metric, row["question"], row["answer"], row["contexts"]], ensure_ascii=False)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[float]:
+        return self._scores.get(key)
+
+    def put_many(self, items: List[Tuple[str, str, str, float]]) -> None:
+        """(key, metric, question, score); NaN scores are not kept so they get retried."""
+        keep = [it for it in items if not pd.isna(it[3])]
+        if not keep:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for key, metric, q, score in keep:
+                    self._scores[key] = score
+                    f.write(json.dumps({"key": key, "metric": metric, "question": q, "score": score}) + "\n")
+
+def _metric_scores(df: pd.DataFrame, name: str, n: int) -> List[float]:
+    if name in df.columns:
+        return [float(x) for x in df[name].tolist()]
+    if {"metric", "score"}.issubset(df.columns):
+        return [float(x) for x in df[df["metric"] == name]["score"].tolist()][:n] or [np.nan] * n
+    print(f"[eval] Unexpected df columns: {list(df.columns)}; {name} left NaN.")
+    return [np.nan] * n
+
+def _score_batch(metric: str, batch: List[Dict], llm, emb, max_workers: int) -> List[float]:
+    #evaluate() sets metric.llm/.embeddings and resets them to None when it returns;
+    #a shared instance would lose its judge under a concurrent batch (rows -> NaN)
+    res = evaluate(
+        Dataset.from_list(batch),
+        metrics=[copy.deepcopy(METRICS[metric])],
+        llm=llm,
+        embeddings=emb,
+        run_config=RunConfig(max_workers=max_workers),
+        raise_exceptions=False,
+    )
+    return _metric_scores(res.to_pandas(), metric, len(batch))
+
+def main(
+    seed_path: Optional[str] = None,
+    judge: str = "openai",
+    judge_model: Optional[str] = None,
+    concurrency: int = 4,
+    batch_size: int = 8,
+    out_csv: Path = OUT_CSV,
+    use_cache: bool = True,
+):
     #Dataset Rows
-    rows = build_rows(SEED)
+    get_engine().warmup()
+    rows = build_rows(load_seed(seed_path))
     if not rows:
         raise RuntimeError("No rows to evaluate.")
 
-    #Evaluator - Model GPT-4o-mini - with temperature 0 since I want it to be as factual and accurate as possible
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)  
-    emb = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-m3",
-        encode_kwargs={"normalize_embeddings": True}
-    )
+    #Evaluator - temperature 0 since I want it to be as factual and accurate as possible
+    llm, judge_id = make_judge(judge, judge_model)
+    #Same warm bge-m3 instance the retriever already loaded (disk-cached, so
+    #re-runs don't re-embed the same question/answer strings for the fallback)
+    emb = get_engine().embeddings
 
-    #Evaluating 1 row at a time ie 1 question at a time
-    per = []
+    cache = ScoreCache(out_csv.with_suffix(".checkpoint.jsonl"))
+    scores: Dict[Tuple[int, str], float] = {}
+    todo: Dict[str, List[int]] = {m: [] for m in METRICS}
     for i, row in enumerate(rows):
-        try:
-            ds = Dataset.from_list([row])
-            res = evaluate(
-                ds,
-                metrics=[answer_relevancy, faithfulness],
-                llm=llm,
-                embeddings=emb,
-            )
-            df = res.to_pandas()
-
-            if {"answer_relevancy", "faithfulness"}.issubset(df.columns):
-                ar = float(df["answer_relevancy"].iloc[0])
-                ff = float(df["faithfulness"].iloc[0])
-            elif {"metric", "score"}.issubset(df.columns):
-                pivot = df[["metric", "score"]].pivot_table(
-                    index=None, columns="metric", values="score", aggfunc="first"
-                )
-                ar = float(pivot.get("answer_relevancy", [np.nan])[0])
-                ff = float(pivot.get("faithfulness", [np.nan])[0])
+        for m in METRICS:
+            hit = cache.get(cache.key(judge_id, m, row)) if use_cache else None
+            if hit is None:
+                todo[m].append(i)
             else:
-                print(f"[eval] Unexpected df columns: {list(df.columns)}; filling fallback for AR.")
-                ar, ff = np.nan, np.nan
-
-            #If Answer_relevancy = NaN, cosine(question, answer)
-            if np.isnan(ar):
-                qv = emb.embed_query(row["question"])
-                av = emb.embed_query(row["answer"])
-                ar = cosine(qv, av)
-
-            per.append({
-                "question": row["question"],
-                "answer_relevancy": ar,
-                "faithfulness": ff,
-            })
-        except Exception as e:
-            print(f"[eval] Row {i} failed: {e}")
-
-    if not per:
-        raise RuntimeError("All rows failed during evaluation.")
+                scores[(i, m)] = hit
+    n_todo = sum(len(v) for v in todo.values())
+    print(f"[eval] {len(rows)} rows x {len(METRICS)} metrics: {len(rows) * len(METRICS) - n_todo} cached, "
+          f"{n_todo} to score with {judge_id} (concurrency={concurrency})")
+
+    #Bounded concurrency: batches of rows per metric run side by side and split
+    #the `concurrency` judge-call budget between them (ragas max_workers)
+    jobs = [(m, idx[j:j + batch_size]) for m, idx in todo.items() for j in range(0, len(idx), batch_size)]
+    outer = max(1, min(concurrency, len(jobs)))
+    inner = max(1, concurrency // outer)
+    with ThreadPoolExecutor(max_workers=outer) as ex:
+        futs = {ex.submit(_score_batch, m, [rows[i] for i in idx], llm, emb, inner): (m, idx) for m, idx in jobs}
+        for fut in as_completed(futs):
+            m, idx = futs[fut]
+            try:
+                got = fut.result()
+            except Exception as e:
+                print(f"[eval] {m} batch of {len(idx)} failed: {e}")
+                got = [np.nan] * len(idx)
+            for i, sc in zip(idx, got):
+                scores[(i, m)] = sc
+            cache.put_many([(cache.key(judge_id, m, rows[i]), m, rows[i]["question"], sc) for i, sc in zip(idx, got)])
+
+    per = []
+    for i, row in enumerate(rows):
+        ar = scores.get((i, "answer_relevancy"), np.nan)
+        ff = scores.get((i, "faithfulness"), np.nan)
+        #If Answer_relevancy = NaN, cosine(question, answer)
+        if np.isnan(ar):
+            qv, av = emb.embed_documents([row["question"], row["answer"]])
+            ar = cosine(qv, av)
+        per.append({
+            "question": row["question"],
+            "answer_relevancy": ar,
+            "faithfulness": ff,
+        })
 
     out = pd.DataFrame(per)
-    out.to_csv("eval_ragas.csv", index=False)
-    print("\n=== RAGAs (per-sample) saved to eval_ragas.csv ===")
+    out.to_csv(out_csv, index=False)
+    print(f"\n=== RAGAs (per-sample) saved to {out_csv} ===")
     print(out)
 
     means = out.drop(columns=["question"]).mean(numeric_only=True)
@@ -132,4 +226,15 @@ def main():
         print(f"{k:>18}: {v:.3f}")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser(description="RAGAS faithfulness / answer_relevancy over the retrieval pipeline")
+    ap.add_argument("--queries", help="JSONL with question (+ module) per line; default: built-in SEED")
+    ap.add_argument("--judge", choices=["openai", "ollama"], default="openai",
+                    help="judge LLM: gpt-4o-mini, or a local Ollama model ($JUDGE_MODEL)")
+    ap.add_argument("--judge-model", help="override the judge model name")
+    ap.add_argument("--concurrency", type=int, default=4, help="max judge calls in flight")
+    ap.add_argument("--batch-size", type=int, default=8, help="rows per ragas.evaluate call (checkpoint unit)")
+    ap.add_argument("--out", default=str(OUT_CSV))
+    ap.add_argument("--no-cache", action="store_true", help="re-score every row, ignoring the checkpoint")
+    args = ap.parse_args()
+    main(args.queries, args.judge, args.judge_model, args.concurrency, args.batch_size, Path(args.out), not args.no_cache)
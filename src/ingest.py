@@ -1,17 +1,27 @@
 # src/ingest.py
+import hashlib
+import json
 import os
 import re
+import shutil
 import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 
+from .chunk_store import ChunkStore, ChunkStoreWriter, INDEX_FILE, META_FILE, MODULES_DIR
 from .config import settings
-from .manifest import load_manifest
+from .embed_cache import cached_hf_embeddings
+from .lexical import LexicalIndexBuilder
+from .structure import StructureIndexBuilder, chunk_labels, display, label_spans, locate
+from .tracing import breakdown, span
+from .vector_index import build_index, describe
+from .manifest import DocRow, load_manifest
+from .reranker import chunk_id
 
 
 #Section Tagging
@@ -77,38 +87,55 @@ def chunk_text(txt: str) -> List[str]:
 
 
 #Building Langchain documents
-def build_corpus_docs() -> List[Document]:
+def build_row_docs(row: DocRow) -> List[Document]:
+    txt_path = Path(row.txt_path)
+    if not txt_path.exists():
+        raise FileNotFoundError(f"TXT not found: {txt_path} (doc_id={row.doc_id})")
+
+    raw = txt_path.read_text(encoding="utf-8", errors="ignore")
+    sections = split_by_headings(raw)
+    #Structural labels come from the real headings of the raw text, mapped onto
+    #each chunk by its char offset (split_by_headings itself keeps no structure)
+    spans = label_spans(raw)
+    sec_pos = locate(raw, sections)
+
+    docs: List[Document] = []
+    for s_idx, sec in enumerate(sections):
+        chunks = chunk_text(sec)
+        chunk_pos = locate(sec, chunks)
+        for c_idx, ch in enumerate(chunks):
+            start = sec_pos[s_idx] + chunk_pos[c_idx] if sec_pos[s_idx] >= 0 and chunk_pos[c_idx] >= 0 else -1
+            labels = chunk_labels(spans, start, len(ch))
+            heading = next((l for l in labels if not l.startswith("chapter_")), "")
+            docs.append(Document(
+                page_content=ch,
+                metadata={
+                    "doc_id": row.doc_id,
+                    "title": row.title,
+                    "module": row.module,
+                    "txt_path": row.txt_path,
+                    "pdf_path": row.pdf_path,
+                    #Section-aware index (section idx + chunk idx within that section)
+                    "chunk_index": (s_idx, c_idx),
+                    #Enclosing Article/Recital when known, else the first label mentioned
+                    "section": display(heading) if heading else detect_section(ch),
+                    "labels": labels,
+                }
+            ))
+    return docs
+
+def load_rows() -> List[DocRow]:
     print(f"[ingest] manifest: {settings.manifest_csv}")
     rows = load_manifest(str(settings.manifest_csv))
     print(f"[ingest] rows: {len(rows)}")
     if not rows:
         raise RuntimeError("Manifest is empty. Run `python -m src.make_manifest` and check data paths.")
+    return rows
 
+def build_corpus_docs() -> List[Document]:
     docs: List[Document] = []
-    for row in rows:
-        txt_path = Path(row.txt_path)
-        if not txt_path.exists():
-            raise FileNotFoundError(f"TXT not found: {txt_path} (doc_id={row.doc_id})")
-
-        raw = txt_path.read_text(encoding="utf-8", errors="ignore")
-        sections = split_by_headings(raw)
-
-        for s_idx, sec in enumerate(sections):
-            chunks = chunk_text(sec)
-            for c_idx, ch in enumerate(chunks):
-                docs.append(Document(
-                    page_content=ch,
-                    metadata={
-                        "doc_id": row.doc_id,
-                        "title": row.title,
-                        "module": row.module,
-                        "txt_path": row.txt_path,
-                        "pdf_path": row.pdf_path,
-                        #Section-aware index (section idx + chunk idx within that section)
-                        "chunk_index": (s_idx, c_idx),
-                        "section": detect_section(ch),
-                    }
-                ))
+    for row in load_rows():
+        docs.extend(build_row_docs(row))
 
     print(f"[ingest] built chunks: {len(docs)}")
     if len(docs) == 0:
@@ -117,32 +144,265 @@ def build_corpus_docs() -> List[Document]:
 
 
 
+#Incremental ingest: content-hash manifest of files and chunk ids stored next to the index
+INGEST_MANIFEST = "ingest_manifest.json"
+
+def _ingest_settings() -> dict:
+    #Any change here invalidates every stored vector
+    return {
+        "store_schema": 2,  #Bump when chunk metadata written by ingest changes
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+        "embedding_model": settings.embedding_model,
+    }
+
+def row_hash(row: DocRow) -> str:
+    h = hashlib.sha256(json.dumps(row.__dict__, sort_keys=True).encode())
+    with open(row.txt_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_ingest_manifest(index_dir: Path) -> dict:
+    p = index_dir / INGEST_MANIFEST
+    if not p.exists():
+        return {}
+    prev = json.loads(p.read_text(encoding="utf-8"))
+    return prev if prev.get("settings") == _ingest_settings() else {}
+
+class PreviousIndex:
+    """
+    Index + chunk store currently on disk; reused chunks are read back one at a
+    time. Vectors come from the flat module sub-indexes, which stay exact
+    whatever ANN type the global index uses.
+    """
+
+    def __init__(self, index_dir: Optional[Path]):
+        import faiss
+        self.rows: Dict[str, int] = {}
+        self.store = None
+        self._where: Dict[int, Tuple[object, int]] = {}
+        if index_dir is None or not (index_dir / META_FILE).exists():
+            return
+        self.store = ChunkStore(index_dir)
+        for p in sorted((index_dir / MODULES_DIR).glob("*.faiss")):
+            sub = faiss.read_index(str(p))
+            for local, r in enumerate(np.load(p.with_suffix(".rows.npy")).tolist()):
+                self._where[r] = (sub, local)
+        #Only chunks whose vector is recoverable count as reusable
+        self.rows = {cid: r for cid, r in self.store.chunk_rows().items() if r in self._where}
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self.rows
+
+    def fetch(self, cid: str) -> Tuple[Document, np.ndarray]:
+        r = self.rows[cid]
+        sub, local = self._where[r]
+        return self.store.get([r])[0], sub.reconstruct(local)
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+#Per-module sub-indexes: vectors copied out of the global index, no second embedding pass
+def write_module_indexes(index, module_rows: Dict[str, List[int]], out_dir: Path) -> None:
+    import faiss
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for module, rows in module_rows.items():
+        rows_arr = np.asarray(rows, dtype=np.int64)
+        sub = faiss.IndexFlatL2(index.d)
+        sub.add(np.stack([index.reconstruct(int(r)) for r in rows_arr]))
+        faiss.write_index(sub, str(out_dir / f"{module}.faiss"))
+        np.save(out_dir / f"{module}.rows.npy", rows_arr)
+        print(f"[ingest] module index {module}: {sub.ntotal} chunks")
+
+def _swap_in(staging: Path, index_dir: Path) -> None:
+    """Replace index_dir with the freshly written staging dir."""
+    old = index_dir.with_name(index_dir.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if index_dir.exists():
+        index_dir.rename(old)
+    staging.rename(index_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+#Streaming pipeline: split (process pool) -> embed (bounded batches) -> FAISS add
+def _split_row(row: DocRow) -> Tuple[List[Document], float]:
+    t = time.perf_counter()
+    docs = build_row_docs(row)
+    return docs, time.perf_counter() - t
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  #Windows
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  #KB on Linux
+
+class IngestStats:
+    def __init__(self):
+        self.docs = self.chunks = self.embedded = 0
+        self.split_s = self.embed_s = self.add_s = 0.0
+
+    def report(self, wall_s: float) -> str:
+        rate = lambda n, t: n / t if t > 0 else float("nan")
+        return (
+            f"[ingest] split  : {self.docs} docs, {self.chunks} chunks in {self.split_s:.1f}s worker time "
+            f"({rate(self.docs, self.split_s):.1f} docs/s, {rate(self.chunks, self.split_s):.0f} chunks/s)\n"
+            f"[ingest] embed  : {self.embedded} new embeddings in {self.embed_s:.1f}s "
+            f"({rate(self.embedded, self.embed_s):.1f} emb/s)\n"
+            f"[ingest] index  : {self.chunks} vectors added in {self.add_s:.2f}s\n"
+            f"[ingest] wall {wall_s:.1f}s, peak RSS {_peak_rss_mb():.0f} MB"
+        )
+
+def iter_entries(plan: List[tuple], reuse: PreviousIndex, workers: int, stats: IngestStats):
+    """
+    Yield [chunk_id, Document, vector|None] in manifest order. Rows that need
+    re-splitting run in a process pool with a bounded number in flight.
+    """
+    todo = [i for i, (_, _, ids) in enumerate(plan) if ids is None]
+    if workers <= 1 or len(todo) <= 1:
+        ex = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        ex = ProcessPoolExecutor(max_workers=workers)
+    futs, nxt, window = {}, 0, max(2, workers * 2)
+    try:
+        for i, (row, _, ids) in enumerate(plan):
+            while ex is not None and nxt < len(todo) and len(futs) < window:
+                futs[todo[nxt]] = ex.submit(_split_row, plan[todo[nxt]][0])
+                nxt += 1
+            if ids is not None:
+                for cid in ids:
+                    stats.chunks += 1
+                    yield [cid, *reuse.fetch(cid)]
+                continue
+            docs, dt = futs.pop(i).result() if ex is not None else _split_row(row)
+            stats.docs += 1
+            stats.split_s += dt
+            for d in docs:
+                stats.chunks += 1
+                yield [chunk_id(d), d, None]
+    finally:
+        if ex is not None:
+            ex.shutdown(cancel_futures=True)
+
+def _batched(it, n: int):
+    batch = []
+    for x in it:
+        batch.append(x)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 #Embedding using bge-m3 + FAISS
-def main():
+def main(full: bool = False, workers: int = 0, batch_size: int = 0):
+    import faiss
+
     t0 = time.time()
-    print(f"[ingest] start → index_dir={settings.index_dir}")
-    settings.index_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or settings.ingest_workers or (os.cpu_count() or 1)
+    batch_size = batch_size or settings.ingest_batch_size
+    index_dir = settings.index_dir
+    print(f"[ingest] start → index_dir={index_dir} ({'full' if full else 'incremental'}, "
+          f"workers={workers}, batch={batch_size})")
+    rows = load_rows()
 
-    docs = build_corpus_docs()
-    print(f"[ingest] documents ready in {time.time()-t0:.1f}s")
+    #bge-m3 behind the disk cache; the model itself only loads on a cache miss
+    print("[ingest] embeddings: BAAI/bge-m3 (normalized cosine, cached)")
+    embed = cached_hf_embeddings(settings.embedding_model, normalize=True)  #Cosine via Dot Product
 
-    print("[ingest] loading embeddings: BAAI/bge-m3 (normalized cosine)")
-    t1 = time.time()
-    embed = HuggingFaceEmbeddings(
-        model_name=settings.embedding_model,          #BAAI/bge-m3
-        encode_kwargs={"normalize_embeddings": True}  #Cosine via Dot Product
-    )
-    print(f"[ingest] embeddings ready in {time.time()-t1:.1f}s")
+    prev = {} if full else load_ingest_manifest(index_dir)
+    reuse = PreviousIndex(index_dir if prev else None)
+
+    #Decide per row: reuse stored chunks/vectors, or re-split + re-embed
+    plan = []
+    new_manifest = {"settings": _ingest_settings(), "docs": {}}
+    for row in rows:
+        h = row_hash(row)
+        p = prev.get("docs", {}).get(row.doc_id)
+        ok = p and p["hash"] == h and all(cid in reuse for cid in p["chunk_ids"])
+        plan.append((row, h, p["chunk_ids"] if ok else None))
+    removed = sorted(set(prev.get("docs", {})) - {r.doc_id for r in rows})
+    n_reused = sum(1 for _, _, ids in plan if ids is not None)
+    print(f"[ingest] docs reused={n_reused} re-embedded={len(plan) - n_reused} removed={len(removed)} {removed or ''}")
+
+    #Everything is written to a staging dir and swapped in at the end, so a
+    #running engine never sees a half-written index
+    staging = index_dir.with_name(index_dir.name + ".staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    writer = ChunkStoreWriter(staging)
+    lexical = LexicalIndexBuilder()
+    structure = StructureIndexBuilder()
+
+    #Entries stream in manifest order whether reused or re-embedded, so the
+    #saved index is the same as a from-scratch build
+    stats = IngestStats()
+    index = None
+    ids_by_doc: Dict[str, List[str]] = {}
+    module_rows: Dict[str, List[int]] = {}
+    for batch in _batched(iter_entries(plan, reuse, workers, stats), batch_size):
+        pending = [e for e in batch if e[2] is None]
+        if pending:
+            with span("embed_batch", chunks=len(pending)) as sp:
+                vecs = embed.embed_documents([e[1].page_content for e in pending])
+                for e, v in zip(pending, vecs):
+                    e[2] = v
+            stats.embed_s += sp.duration_s
+            stats.embedded += len(pending)
 
-    print("[ingest] building FAISS (first run may download models)…")
-    t2 = time.time()
-    vs = FAISS.from_documents(docs, embed)
-    print(f"[ingest] FAISS built in {time.time()-t2:.1f}s")
+        t = time.perf_counter()
+        mat = np.asarray([e[2] for e in batch], dtype=np.float32)
+        if index is None:
+            index = faiss.IndexFlatL2(mat.shape[1])  #Exact staging index; ANN types are built from it below
+        index.add(mat)
+        for cid, d, _ in batch:
+            row = writer.add(cid, d.page_content, d.metadata)
+            lexical.add(row, d.page_content, d.metadata["doc_id"])
+            structure.add(row, d.metadata["doc_id"], d.metadata.get("labels", []))
+            ids_by_doc.setdefault(d.metadata["doc_id"], []).append(cid)
+            module_rows.setdefault(d.metadata.get("module", ""), []).append(row)
+        stats.add_s += time.perf_counter() - t
+    reuse.close()
+
+    if index is None:
+        raise RuntimeError("Zero chunks built. Check your TXT content and manifest paths.")
+    writer.close()
+    for row, h, _ in plan:
+        new_manifest["docs"][row.doc_id] = {"hash": h, "chunk_ids": ids_by_doc.get(row.doc_id, [])}
+
+    print(stats.report(time.time() - t0))
+    if hasattr(embed, "hits"):
+        print(f"[ingest] embedding cache hits={embed.hits} misses={embed.misses}")
+
+    with span("vector_index", type=settings.index_type) as sp:
+        if settings.index_type == "flat":
+            faiss.write_index(index, str(staging / INDEX_FILE))
+        else:
+            ann = build_index(index.reconstruct_n(0, index.ntotal), settings.index_type)
+            faiss.write_index(ann, str(staging / INDEX_FILE))
+            sp.set(index=describe(ann))
+    with span("module_indexes"):
+        write_module_indexes(index, module_rows, staging / MODULES_DIR)
+    with span("bm25_index", terms=len(lexical.vocab)):
+        lexical.save(staging)
+    with span("structure_index", keys=sum(len(m) for m in structure.docs.values())):
+        structure.save(staging)
+    (staging / INGEST_MANIFEST).write_text(json.dumps(new_manifest, indent=1), encoding="utf-8")
 
-    print(f"[ingest] saving FAISS to {settings.index_dir} …")
-    vs.save_local(str(settings.index_dir))
-    print("[ingest] saved files:", os.listdir(settings.index_dir))
+    print(f"[ingest] saving index to {index_dir} …")
+    with span("swap_in"):
+        _swap_in(staging, index_dir)
+    print("[ingest] saved files:", os.listdir(index_dir))
     print(f"[ingest] DONE total {time.time()-t0:.1f}s")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="ignore the ingest manifest and re-embed everything")
+    ap.add_argument("--workers", type=int, default=0, help="split processes (default: settings / CPU count)")
+    ap.add_argument("--batch-size", type=int, default=0, help="chunks per embed/index batch")
+    args = ap.parse_args()
+    with span("ingest", full=args.full) as root:
+        main(full=args.full, workers=args.workers, batch_size=args.batch_size)
+    print(breakdown(root))
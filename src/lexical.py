@@ -0,0 +1,126 @@
+import json, re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+
+LEXICAL_FILE = "lexical.npz"
+VOCAB_FILE = "lexical_vocab.json"
+
+#Legal references become single tokens: "Article 4" -> article_4, "Recital 18" -> recital_18
+REF = re.compile(r"\b(article|art\.|recital|chapter|annex|paragraph)\s+(\d+[a-z]?|[ivxlc]+)\b", re.IGNORECASE)
+#CELEX numbers (32019L0790) and OJ/act numbers (2019/790) are kept whole by the token pattern
+TOKEN = re.compile(r"[a-z]+_[0-9a-z]+|\d{4}/\d+|\d{5}[a-z]\d{4}|[a-z0-9]+")
+STOP = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with "
+    "shall may such any other their these those under where what who whom how does do not".split()
+)
+
+def _ref_token(m: "re.Match") -> str:
+    kind = m.group(1).lower().rstrip(".")
+    return f"{'article' if kind == 'art' else kind}_{m.group(2).lower()}"
+
+def tokenize(text: str) -> List[str]:
+    text = REF.sub(_ref_token, text)
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOP and len(t) > 1]
+
+def doc_tokens(doc_id: str) -> List[str]:
+    """Tokens that make a chunk findable by its act number, e.g. CELEX_32019L0790 -> 32019l0790."""
+    return tokenize(doc_id.replace("_", " "))
+
+class LexicalIndexBuilder:
+    """Accumulates term counts per chunk row during ingest, then writes CSR postings."""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self._terms: List[np.ndarray] = []
+        self._rows: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self.doc_len: List[int] = []
+
+    def add(self, row: int, text: str, doc_id: str = "") -> None:
+        assert row == len(self.doc_len), "rows must be added in index order"
+        toks = tokenize(text) + (doc_tokens(doc_id) if doc_id else [])
+        counts: Dict[int, int] = {}
+        for t in toks:
+            tid = self.vocab.setdefault(t, len(self.vocab))
+            counts[tid] = counts.get(tid, 0) + 1
+        self.doc_len.append(len(toks))
+        if counts:
+            self._terms.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            self._tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            self._rows.append(np.full(len(counts), row, dtype=np.int32))
+
+    def save(self, root: Path, k1: Optional[float] = None, b: Optional[float] = None) -> None:
+        k1 = settings.bm25_k1 if k1 is None else k1
+        b = settings.bm25_b if b is None else b
+        n_docs, n_terms = len(self.doc_len), len(self.vocab)
+        terms = np.concatenate(self._terms) if self._terms else np.empty(0, np.int32)
+        rows = np.concatenate(self._rows) if self._rows else np.empty(0, np.int32)
+        tfs = np.concatenate(self._tfs) if self._tfs else np.empty(0, np.float32)
+
+        order = np.argsort(terms, kind="stable")
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+
+        #Precompute the full BM25 weight per posting so a query is just gathers + adds
+        doc_len = np.asarray(self.doc_len, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 1.0
+        df = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * doc_len[rows] / max(avgdl, 1e-6))
+        weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        np.savez(Path(root) / LEXICAL_FILE, indptr=indptr, rows=rows, weights=weights,
+                 n_docs=np.int64(n_docs))
+        (Path(root) / VOCAB_FILE).write_text(json.dumps(self.vocab), encoding="utf-8")
+
+class LexicalIndex:
+    """BM25 over CSR postings; scoring is NumPy gathers and one scatter-add per query."""
+
+    def __init__(self, root: Path):
+        root = Path(root)
+        z = np.load(root / LEXICAL_FILE)
+        self.indptr = z["indptr"]
+        self.rows = z["rows"]
+        self.weights = z["weights"]
+        self.n_docs = int(z["n_docs"])
+        self.vocab: Dict[str, int] = json.loads((root / VOCAB_FILE).read_text(encoding="utf-8"))
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (Path(root) / LEXICAL_FILE).exists()
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) best first; `allowed` optionally restricts to a set of global rows."""
+        tids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+        if not tids or not self.n_docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        spans = [np.arange(self.indptr[t], self.indptr[t + 1]) for t in tids]
+        idx = np.concatenate(spans)
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        np.add.at(scores, self.rows[idx], self.weights[idx])
+        if allowed is not None:
+            mask = np.zeros(self.n_docs, dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0.0
+        hit = np.flatnonzero(scores)
+        if not len(hit):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return hit.astype(np.int64), scores[hit]
+
+def rrf_fuse(ranked_lists: List[np.ndarray], k: int, rrf_k: Optional[int] = None) -> np.ndarray:
+    """Reciprocal-rank fusion of several best-first row lists; returns the fused top-k rows."""
+    rrf_k = settings.rrf_k if rrf_k is None else rrf_k
+    fused: Dict[int, float] = {}
+    for ranked in ranked_lists:
+        for rank, r in enumerate(ranked.tolist()):
+            fused[r] = fused.get(r, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return np.asarray([r for r, _ in best], dtype=np.int64)
@@ -0,0 +1,149 @@
+import hashlib, json, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+#Deterministic stand-in for the Ollama HTTP API, for offline benchmarks.
+#Same prompt -> same reply. Replies are built from the prompt itself: the
+#planner gets a JSON plan, the writer gets extractive bullets with the
+#prompt's citation tokens, the reviewer gets a fixed note. Latency is
+#simulated with a time-to-first-token and a per-token delay, plus a load
+#delay whenever a model that is not resident is requested (max_loaded models
+#stay resident, least recently used is evicted first).
+
+CITATION = re.compile(r"CITATION: (\[[^\]]+\])")
+QUESTION = re.compile(r"Question:\s*(.+?)\n", re.DOTALL)
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\S+\s*", text)
+
+def reply(prompt: str) -> str:
+    if "JSON only:" in prompt:
+        m = QUESTION.search(prompt)
+        q = m.group(1).strip() if m else ""
+        parts = [p.strip(" ?") + "?" for p in re.split(r"\band\b|;", q) if p.strip(" ?")][:3] or [q]
+        return json.dumps({"sub_questions": parts, "keywords": [], "notes": "mock plan"})
+    if "Notes:" in prompt and "CITATION:" not in prompt:
+        return "1) No missing elements detected (mock reviewer). 2) Follow-up: which exceptions apply?"
+    cites = CITATION.findall(prompt)
+    if not cites:
+        return "Not enough evidence in provided context."
+    #Echo the first sentence after each citation so the answer stays grounded in the context
+    body = []
+    for cite in cites[:4]:
+        text = prompt.split(f"CITATION: {cite}", 1)[1].strip().split("\n", 1)[0]
+        sent = re.split(r"(?<=[.;])\s", text, 1)[0][:200]
+        body.append(f"• {sent} {cite}")
+    return "Based on the provided context, the answer is summarised below.\n" + "\n".join(body)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ttft_s = 0.05
+    token_s = 0.002
+    load_s = 0.0
+    max_loaded = 1
+    resident: List[str] = []
+    lock = threading.Lock()
+
+    def log_message(self, *args) -> None:  #Quiet
+        pass
+
+    def _json(self, code: int, obj: Dict) -> None:
+        data = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _load(self, model: str) -> float:
+        """Seconds spent loading `model` for this request (0 when already resident)."""
+        with self.lock:
+            if model in self.resident:
+                self.resident.remove(model)
+                self.resident.append(model)
+                return 0.0
+            self.resident.append(model)
+            del self.resident[:-self.max_loaded]
+            time.sleep(self.load_s)
+            return self.load_s
+
+    def do_GET(self) -> None:
+        if self.path == "/api/tags":
+            self._json(200, {"models": []})
+        elif self.path == "/api/ps":
+            with self.lock:
+                self._json(200, {"models": [{"name": m, "model": m} for m in self.resident]})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/api/generate":
+            self._json(404, {"error": "not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = body.get("prompt", "")
+        limit = (body.get("options") or {}).get("num_predict")
+        toks = _words(reply(prompt)) if prompt else []
+        if limit:
+            toks = toks[:limit]
+        load_s = self._load(body.get("model", ""))
+        final = {
+            "model": body.get("model", ""), "done": True,
+            "eval_count": len(toks), "prompt_eval_count": len(prompt) // 4,
+            "load_duration": int(load_s * 1e9),
+            "eval_duration": int(self.token_s * len(toks) * 1e9),
+        }
+        if not body.get("stream", True):
+            time.sleep(self.ttft_s + self.token_s * len(toks))
+            self._json(200, {**final, "response": "".join(toks)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj: Dict) -> None:
+            data = (json.dumps(obj) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        time.sleep(self.ttft_s)
+        for i, t in enumerate(toks):
+            if i:
+                time.sleep(self.token_s)
+            chunk({"model": body.get("model", ""), "response": t, "done": False})
+        chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+def serve(port: int = 0, ttft_ms: float = 50, token_ms: float = 2, load_ms: float = 0,
+          max_loaded: int = 1) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the mock in a daemon thread; returns (server, base_url). port=0 picks a free port."""
+    handler = type("MockOllama", (_Handler,), {
+        "ttft_s": ttft_ms / 1000, "token_s": token_ms / 1000, "load_s": load_ms / 1000,
+        "max_loaded": max(1, max_loaded), "resident": [], "lock": threading.Lock(),
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+def fingerprint() -> str:
+    """Changes whenever the canned replies change, so reports can tell mock versions apart."""
+    return hashlib.sha1(open(__file__, "rb").read()).hexdigest()[:12]
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Deterministic local Ollama stand-in")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--ttft-ms", type=float, default=50)
+    ap.add_argument("--token-ms", type=float, default=2)
+    ap.add_argument("--load-ms", type=float, default=0, help="simulated weight load per model switch")
+    ap.add_argument("--max-loaded", type=int, default=1)
+    args = ap.parse_args()
+    httpd, url = serve(args.port, args.ttft_ms, args.token_ms, args.load_ms, args.max_loaded)
+    print(f"[mock-ollama] serving on {url} (set OLLAMA_BASE={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
@@ -1,43 +1,368 @@
-import json, os, requests, time
-from typing import Optional
-from requests.exceptions import ConnectionError, ReadTimeout
+import asyncio, json, os, requests, threading, time, weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ReadTimeout
+
+from .tracing import Span, start_span
 
 RETRIES = int(os.getenv("OLLAMA_RETRIES", "3"))
 RETRY_BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.8"))
 
 BASE = os.getenv("OLLAMA_BASE", "http://localhost:11434")
 
+#Should match the server's OLLAMA_NUM_PARALLEL; caps concurrent generations per client process
+NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+
+TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "600"))
+
+#Sent with every request so Ollama keeps the weights loaded between questions ("-1" = forever)
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+#Should match the server's OLLAMA_MAX_LOADED_MODELS; 1 = the planner and writer evict each other
+MAX_LOADED = int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "1"))
+
+#A queued call for the resident model may overtake the oldest waiter at most this many times
+MAX_BYPASS = int(os.getenv("OLLAMA_MAX_BYPASS", "8"))
+
+#load_duration above this counts as a model (re)load rather than a warm hit
+LOAD_EVENT_S = float(os.getenv("OLLAMA_LOAD_EVENT_S", "0.25"))
+
 class OllamaError(RuntimeError): pass
 
-def _collect_response_text(r: requests.Response) -> str:
-    r.raise_for_status()
-    text = ""
-    for line in r.iter_lines(decode_unicode=True):
-        if not line:
-            continue
+class _Waiter:
+    __slots__ = ("model", "granted")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.granted = False
+
+class ModelScheduler:
+    """
+    Process-wide cap on in-flight generations that is aware of which models
+    Ollama has resident. When a slot frees up, the oldest queued call for a
+    model that is running or resident goes first, so concurrent users' calls
+    are grouped by model instead of alternating planner/writer and forcing a
+    reload per switch. The oldest waiter is overtaken at most `max_bypass`
+    times in a row, so no model starves.
+    """
+
+    def __init__(self, slots: int, max_loaded: int = MAX_LOADED, max_bypass: int = MAX_BYPASS):
+        self.slots = max(1, slots)
+        self.max_loaded = max(1, max_loaded)
+        self.max_bypass = max_bypass
+        self.inflight = 0
+        self._cond = threading.Condition()
+        self._waiting: List[_Waiter] = []
+        self._running: Dict[str, int] = {}
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        self._bypassed = 0
+
+    def resize(self, slots: int) -> None:
+        with self._cond:
+            self.slots = max(1, slots)
+            self._dispatch()
+
+    def resident(self) -> List[str]:
+        """Models believed loaded, least recently used first."""
+        with self._cond:
+            return list(self._resident)
+
+    def mark_resident(self, model: str) -> None:
+        with self._cond:
+            self._touch(model)
+
+    def _touch(self, model: str) -> None:
+        self._resident.pop(model, None)
+        self._resident[model] = None
+        while len(self._resident) > self.max_loaded:
+            self._resident.popitem(last=False)
+
+    def _dispatch(self) -> None:
+        granted = False
+        while self._waiting and self.inflight < self.slots:
+            pick = 0
+            if self._bypassed < self.max_bypass:
+                warm = set(self._running) | set(self._resident)
+                pick = next((i for i, w in enumerate(self._waiting) if w.model in warm), 0)
+            self._bypassed = self._bypassed + 1 if pick else 0
+            w = self._waiting.pop(pick)
+            w.granted = True
+            self.inflight += 1
+            self._running[w.model] = self._running.get(w.model, 0) + 1
+            self._touch(w.model)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, model: str) -> None:
+        """Block until a slot for `model` is granted; pair with release()."""
+        w = _Waiter(model)
+        with self._cond:
+            self._waiting.append(w)
+            self._dispatch()
+            while not w.granted:
+                self._cond.wait()
+
+    def release(self, model: str) -> None:
+        with self._cond:
+            self.inflight -= 1
+            self._running[model] -= 1
+            if not self._running[model]:
+                del self._running[model]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        self.acquire(model)
         try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
-            continue
-        if "error" in obj:
-            raise OllamaError(obj["error"])
-        text += obj.get("response", "")
-        if obj.get("done"):
-            break
-    return text.strip()
+            yield
+        finally:
+            self.release(model)
 
-def ollama_generate(model: str, prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None) -> str:
+#Process-wide (threads of one request or of many server requests)
+_SCHED = ModelScheduler(NUM_PARALLEL)
+
+def set_llm_concurrency(n: int) -> None:
+    """Resize the generation cap (e.g. at server startup)."""
+    _SCHED.resize(n)
+
+def llm_inflight() -> int:
+    return _SCHED.inflight
+
+def _llm_slot(model: str):
+    return _SCHED.slot(model)
+
+@asynccontextmanager
+async def _allm_slot(model: str) -> AsyncIterator[None]:
+    """_llm_slot() for coroutines: the blocking wait runs in the default executor."""
+    fut = asyncio.get_running_loop().run_in_executor(None, _SCHED.acquire, model)
+    try:
+        await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        #The wait in the executor cannot be interrupted; hand the slot back once it is granted
+        fut.add_done_callback(lambda f: f.exception() is None and _SCHED.release(model))
+        raise
+    try:
+        yield
+    finally:
+        _SCHED.release(model)
+
+#Per-model counters: how much time goes to loading weights vs prefill vs generating
+_STATS: Dict[str, Dict[str, float]] = {}
+_STATS_LOCK = threading.Lock()
+
+def _count(model: str, obj: Dict) -> bool:
+    """Fold Ollama's final-message durations (ns) into the model's counters; True if it was a load."""
+    load_s = obj.get("load_duration", 0) / 1e9
+    loaded = load_s >= LOAD_EVENT_S
+    with _STATS_LOCK:
+        st = _STATS.setdefault(model, {"calls": 0, "loads": 0, "load_s": 0.0, "prompt_s": 0.0, "gen_s": 0.0})
+        st["calls"] += 1
+        st["loads"] += int(loaded)
+        st["load_s"] += load_s
+        st["prompt_s"] += obj.get("prompt_eval_duration", 0) / 1e9
+        st["gen_s"] += obj.get("eval_duration", 0) / 1e9
+    _SCHED.mark_resident(model)
+    return loaded
+
+def model_stats() -> Dict[str, Any]:
+    """Per-model calls / loads / seconds spent loading, in prefill and generating, plus totals."""
+    with _STATS_LOCK:
+        per_model = {m: dict(st) for m, st in _STATS.items()}
+    total = {k: sum(st[k] for st in per_model.values()) for k in ("calls", "loads", "load_s", "prompt_s", "gen_s")}
+    busy = total["load_s"] + total["prompt_s"] + total["gen_s"]
+    total["load_share"] = total["load_s"] / busy if busy else 0.0
+    return {"models": per_model, "total": total, "resident": _SCHED.resident()}
+
+def reset_model_stats() -> None:
+    with _STATS_LOCK:
+        _STATS.clear()
+
+#Pooled keep-alive session shared by all threads of the process
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                pool = max(4, NUM_PARALLEL * 2)
+                s.mount("http://", HTTPAdapter(pool_connections=pool, pool_maxsize=pool))
+                s.mount("https://", HTTPAdapter(pool_connections=pool, pool_maxsize=pool))
+                _SESSION = s
+    return _SESSION
+
+def _payload(model: str, prompt: str, temperature: float, max_tokens: Optional[int]) -> Dict:
     payload = {"model": model, "prompt": prompt, "options": {"temperature": temperature}, "stream": True}
+    if KEEP_ALIVE:
+        payload["keep_alive"] = KEEP_ALIVE
     if max_tokens is not None:
         payload["options"]["num_predict"] = max_tokens
+    return payload
+
+def _parse_line(line: str) -> Optional[Dict]:
+    if not line:
+        return None
+    try:
+        obj = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if "error" in obj:
+        raise OllamaError(obj["error"])
+    return obj
+
+def ollama_stream(model: str, prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield response tokens as Ollama streams them. Connection failures are
+    retried with backoff until the first token arrives; after that a broken
+    stream raises OllamaError since the partial reply cannot be replayed.
+    Holds one of the process-wide generation slots while it streams.
+    """
+    payload = _payload(model, prompt, temperature, max_tokens)
     url = f"{BASE}/api/generate"
 
+    sp = start_span("ollama_generate", model=model)
+    try:
+        with _llm_slot(model):
+            sp.set(queue_s=sp.elapsed())
+            yield from _stream(url, payload, sp)
+    finally:
+        sp.end()
+
+def _record(sp: Span, obj: Dict, chunks: int) -> None:
+    """Token counts and server-side durations (ns) from Ollama's final message."""
+    sp.set(tokens=obj.get("eval_count", chunks), prompt_tokens=obj.get("prompt_eval_count", 0))
+    if obj.get("load_duration"):
+        sp.set(load_s=obj["load_duration"] / 1e9)
+    if _count(sp.attrs.get("model", ""), obj):
+        sp.set(model_load=True)
+
+def _stream(url: str, payload: Dict, sp: Span) -> Iterator[str]:
     last_err = None
     for attempt in range(1, RETRIES + 1):
+        started = False
         try:
-            with requests.post(url, json=payload, stream=True, timeout=600) as r:
-                return _collect_response_text(r)
-        except (ConnectionError, ReadTimeout) as e:
+            with get_session().post(url, json=payload, stream=True, timeout=TIMEOUT) as r:
+                r.raise_for_status()
+                chunks = 0
+                for line in r.iter_lines(decode_unicode=True):
+                    obj = _parse_line(line)
+                    if obj is None:
+                        continue
+                    tok = obj.get("response", "")
+                    if tok:
+                        if not started:
+                            sp.set(ttft_s=sp.elapsed())
+                        started = True
+                        chunks += 1
+                        yield tok
+                    if obj.get("done"):
+                        _record(sp, obj, chunks)
+                        return
+            return
+        except (ConnectionError, ReadTimeout, ChunkedEncodingError) as e:
+            if started:
+                raise OllamaError(f"Ollama stream interrupted: {e}") from e
             last_err = e
             time.sleep(RETRY_BACKOFF * attempt)
     raise OllamaError(f"Ollama request failed after {RETRIES} retries: {last_err}")
+
+def ollama_generate(model: str, prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None) -> str:
+    return "".join(ollama_stream(model, prompt, temperature=temperature, max_tokens=max_tokens)).strip()
+
+def preload(models: Sequence[str]) -> Dict[str, float]:
+    """
+    Load models ahead of the first question: an empty prompt makes Ollama load
+    the weights (held for KEEP_ALIVE) without generating. Models are given in
+    priority order and only the first MAX_LOADED are loaded, since any more
+    would just evict each other. Returns model -> load seconds.
+    """
+    out = {}
+    for model in list(dict.fromkeys(models))[:MAX_LOADED]:
+        sp = start_span("ollama_load", model=model)
+        try:
+            with _llm_slot(model):
+                body = {"model": model, "prompt": "", "stream": False}
+                if KEEP_ALIVE:
+                    body["keep_alive"] = KEEP_ALIVE
+                r = get_session().post(f"{BASE}/api/generate", json=body, timeout=TIMEOUT)
+                r.raise_for_status()
+                _record(sp, r.json(), 0)
+                out[model] = sp.elapsed()
+        finally:
+            sp.end()
+    return out
+
+def ollama_resident() -> List[str]:
+    """Models Ollama reports as loaded right now (GET /api/ps); also resyncs the scheduler's view."""
+    r = get_session().get(f"{BASE}/api/ps", timeout=TIMEOUT)
+    r.raise_for_status()
+    models = [m.get("name") or m.get("model", "") for m in r.json().get("models", [])]
+    for m in models:
+        _SCHED.mark_resident(m)
+    return models
+
+#Async variant (httpx); one pooled client per event loop
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _async_client():
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        pool = max(4, NUM_PARALLEL * 2)
+        client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+async def ollama_astream(model: str, prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+    """ollama_stream() for asyncio callers; waits for and holds a generation slot the same way."""
+    import httpx
+    payload = _payload(model, prompt, temperature, max_tokens)
+    url = f"{BASE}/api/generate"
+
+    sp = start_span("ollama_generate", model=model)
+    try:
+        async with _allm_slot(model):
+            sp.set(queue_s=sp.elapsed())
+            last_err = None
+            for attempt in range(1, RETRIES + 1):
+                started = False
+                try:
+                    async with _async_client().stream("POST", url, json=payload) as r:
+                        r.raise_for_status()
+                        chunks = 0
+                        async for line in r.aiter_lines():
+                            obj = _parse_line(line)
+                            if obj is None:
+                                continue
+                            tok = obj.get("response", "")
+                            if tok:
+                                if not started:
+                                    sp.set(ttft_s=sp.elapsed())
+                                started = True
+                                chunks += 1
+                                yield tok
+                            if obj.get("done"):
+                                _record(sp, obj, chunks)
+                                return
+                    return
+                except (httpx.TransportError,) as e:
+                    if started:
+                        raise OllamaError(f"Ollama stream interrupted: {e}") from e
+                    last_err = e
+                    await asyncio.sleep(RETRY_BACKOFF * attempt)
+            raise OllamaError(f"Ollama request failed after {RETRIES} retries: {last_err}")
+    finally:
+        sp.end()
+
+async def ollama_agenerate(model: str, prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None) -> str:
+    parts = [tok async for tok in ollama_astream(model, prompt, temperature=temperature, max_tokens=max_tokens)]
+    return "".join(parts).strip()
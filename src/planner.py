@@ -1,8 +1,12 @@
-import json, re, os
+import copy, json, re, os, threading, time
+from collections import OrderedDict
 from typing import Dict
+from .answer_cache import normalize_question
 from .ollama_client import ollama_generate
+from .tracing import traced
 
 PLANNER_MODEL = os.getenv("PLANNER_MODEL", "deepseek-r1:8b")
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "512"))
 
 PLANNER_SYS = (
   "You are a research planner for EU tech/copyright law. "
@@ -14,7 +18,42 @@ PLANNER_SYS = (
   "Output STRICT JSON with keys: sub_questions (list), keywords (list), notes (string)."
 )
 
-def plan(question: str) -> Dict:
+#Fast path: questions with none of these signals come back as [question] anyway
+MULTI_CLAUSE = re.compile(
+    r"\b(and|or|versus|vs\.?|compare[ds]?|comparison|difference|differ|both|as well as|whereas|while)\b|[;]",
+    re.IGNORECASE,
+)
+#Topics the planner prompt deliberately splits even when phrased as one clause
+SPLIT_TOPICS = re.compile(r"text[- ]and[- ]data mining|\btdm\b", re.IGNORECASE)
+MAX_SIMPLE_WORDS = 18
+
+def needs_decomposition(question: str) -> bool:
+    q = question.strip()
+    if SPLIT_TOPICS.search(q) or MULTI_CLAUSE.search(q):
+        return True
+    if q.count("?") > 1:
+        return True
+    return len(q.split()) > MAX_SIMPLE_WORDS
+
+_CACHE: "OrderedDict[str, Dict]" = OrderedDict()
+_LOCK = threading.Lock()
+_METRICS = {"calls": 0, "cache_hits": 0, "fast_path": 0, "llm_calls": 0, "llm_time_s": 0.0}
+
+def planner_metrics() -> Dict:
+    """Invocation counts plus estimated latency saved (skipped calls x mean LLM plan time)."""
+    with _LOCK:
+        m = dict(_METRICS)
+    avg = m["llm_time_s"] / m["llm_calls"] if m["llm_calls"] else 0.0
+    m["llm_rate"] = m["llm_calls"] / m["calls"] if m["calls"] else 0.0
+    m["avg_llm_s"] = avg
+    m["saved_s_est"] = (m["cache_hits"] + m["fast_path"]) * avg
+    return m
+
+def _bump(key: str, by=1) -> None:
+    with _LOCK:
+        _METRICS[key] += by
+
+def _llm_plan(question: str) -> Dict:
     prompt = f"{PLANNER_SYS}\n\nQuestion: {question}\n\nJSON only:"
     raw = ollama_generate(PLANNER_MODEL, prompt, temperature=0.2, max_tokens=512)
     m = re.search(r"\{.*\}", raw, re.DOTALL)
@@ -26,3 +65,30 @@ def plan(question: str) -> Dict:
     subs = data.get("sub_questions") or [question]
     data["sub_questions"] = subs[:3]
     return data
+
+@traced("plan")
+def plan(question: str, use_cache: bool = True, fast_path: bool = True) -> Dict:
+    _bump("calls")
+    key = f"{PLANNER_MODEL}|{normalize_question(question)}"
+    if use_cache:
+        with _LOCK:
+            hit = _CACHE.get(key)
+            if hit is not None:
+                _CACHE.move_to_end(key)
+                _METRICS["cache_hits"] += 1
+                return copy.deepcopy(hit)
+
+    if fast_path and not needs_decomposition(question):
+        _bump("fast_path")
+        return {"sub_questions": [question], "keywords": [], "notes": "fast-path: single-clause question"}
+
+    t0 = time.perf_counter()
+    data = _llm_plan(question)
+    with _LOCK:
+        _METRICS["llm_calls"] += 1
+        _METRICS["llm_time_s"] += time.perf_counter() - t0
+        if use_cache and PLAN_CACHE_SIZE > 0:
+            _CACHE[key] = copy.deepcopy(data)
+            while len(_CACHE) > PLAN_CACHE_SIZE:
+                _CACHE.popitem(last=False)
+    return data
@@ -0,0 +1,97 @@
+import json, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    module   TEXT NOT NULL,
+    doc_id   TEXT NOT NULL,
+    done     INTEGER NOT NULL DEFAULT 0,
+    note     TEXT NOT NULL DEFAULT '',
+    updated  REAL NOT NULL,
+    PRIMARY KEY (module, doc_id)
+);
+"""
+
+class ProgressStore:
+    """
+    SQLite store for per-document progress (done flag + note). Every write is
+    one transaction and only touches the row when the value actually changed,
+    so widget reruns cost a read at most. WAL + busy_timeout let several app
+    sessions / processes share the file. A legacy user_progress.json is
+    imported once, on first open of an empty store.
+    """
+
+    def __init__(self, path: Optional[Path] = None, legacy_json: Optional[Path] = None):
+        self.path = Path(path or settings.progress_db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.migrate_json(Path(legacy_json or settings.progress_legacy_json))
+
+    def migrate_json(self, path: Path) -> int:
+        """Import {module: {doc_id: {done, note}}} from the old JSON file; renamed to *.migrated after."""
+        if not path.exists():
+            return 0
+        with self._lock:
+            if self._db.execute("SELECT COUNT(*) FROM progress").fetchone()[0]:
+                return 0
+            state = json.loads(path.read_text() or "{}")
+            now = time.time()
+            rows = [
+                (m, doc_id, int(bool(info.get("done", False))), info.get("note", "") or "", now)
+                for m, docs in state.items() for doc_id, info in docs.items()
+            ]
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO progress(module, doc_id, done, note, updated) VALUES (?, ?, ?, ?, ?)", rows
+                )
+        path.rename(path.with_name(path.name + ".migrated"))
+        return len(rows)
+
+    def module(self, module: str) -> Dict[str, Dict[str, Any]]:
+        """doc_id -> {"done", "note"} for one module."""
+        with self._lock:
+            rows = self._db.execute("SELECT doc_id, done, note FROM progress WHERE module = ?", (module,)).fetchall()
+        return {doc_id: {"done": bool(done), "note": note} for doc_id, done, note in rows}
+
+    def all(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """module -> doc_id -> {"done", "note"}, same shape as the old JSON file."""
+        with self._lock:
+            rows = self._db.execute("SELECT module, doc_id, done, note FROM progress ORDER BY module, doc_id").fetchall()
+        out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for m, doc_id, done, note in rows:
+            out.setdefault(m, {})[doc_id] = {"done": bool(done), "note": note}
+        return out
+
+    def _upsert(self, module: str, doc_id: str, column: str, value: Any) -> bool:
+        #The WHERE clause turns an unchanged value into a no-op, so nothing is written
+        with self._lock, self._db:
+            n = self._db.execute(
+                f"INSERT INTO progress(module, doc_id, {column}, updated) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT(module, doc_id) DO UPDATE SET {column} = excluded.{column}, updated = excluded.updated "
+                f"WHERE {column} != excluded.{column}",
+                (module, doc_id, value, time.time()),
+            ).rowcount
+        return n > 0
+
+    def set_done(self, module: str, doc_id: str, done: bool) -> bool:
+        """True if the stored value changed."""
+        return self._upsert(module, doc_id, "done", int(bool(done)))
+
+    def set_note(self, module: str, doc_id: str, note: str) -> bool:
+        return self._upsert(module, doc_id, "note", note or "")
+
+_STORE: Optional[ProgressStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_progress_store() -> ProgressStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ProgressStore()
+    return _STORE
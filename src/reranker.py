@@ -0,0 +1,134 @@
+import hashlib, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+def chunk_id(d: Any) -> str:
+    """Stable id for a chunk: doc_id + (section idx, chunk idx) from ingest."""
+    meta = d.metadata
+    idx = meta.get("chunk_index", ())
+    if isinstance(idx, (list, tuple)):
+        idx = "-".join(str(i) for i in idx)
+    return f"{meta.get('doc_id')}:{idx}"
+
+#(query, chunk_id, text digest): a re-ingest reuses chunk ids for edited text
+CacheKey = Tuple[str, str, str]
+
+def _cache_key(query: str, d: Any) -> CacheKey:
+    digest = hashlib.blake2b(d.page_content.encode("utf-8"), digest_size=8).hexdigest()
+    return query, chunk_id(d), digest
+
+class Reranker:
+    """
+    Resident bge-reranker cross-encoder. Pairs for several queries are scored
+    in one predict() call and (query, chunk_id, text digest) -> score is kept
+    in an LRU.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None,
+        threads: Optional[int] = None,
+        cache_size: Optional[int] = None,
+    ):
+        self.model_name = model_name or settings.reranker_model
+        self.batch_size = batch_size or settings.reranker_batch_size
+        self.max_length = max_length or settings.reranker_max_length
+        self.threads = settings.reranker_threads if threads is None else threads
+        self.cache_size = settings.reranker_cache_size if cache_size is None else cache_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+        self._cache: "OrderedDict[CacheKey, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warmup(self) -> "Reranker":
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    #sentence_transformers pulls in torch; import it only when the model is needed
+                    from sentence_transformers import CrossEncoder
+                    if self.threads > 0:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self
+
+    def _cache_get(self, key: CacheKey) -> Optional[float]:
+        with self._cache_lock:
+            s = self._cache.get(key)
+            if s is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return s
+
+    def _cache_put(self, key: CacheKey, score: float) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score_many(self, queries: Sequence[str], docs_per_query: Sequence[List[Any]]) -> List[List[float]]:
+        """Score every (query, doc) pair across all queries with a single predict()."""
+        out: List[List[Optional[float]]] = []
+        todo: List[Tuple[int, int, CacheKey, str]] = []
+        for qi, (q, docs) in enumerate(zip(queries, docs_per_query)):
+            row: List[Optional[float]] = []
+            for di, d in enumerate(docs):
+                key = _cache_key(q, d)
+                s = self._cache_get(key)
+                if s is None:
+                    todo.append((qi, di, key, d.page_content))
+                row.append(s)
+            out.append(row)
+
+        if todo:
+            #Same pair can appear twice (e.g. repeated sub-question); score it once
+            uniq: Dict[CacheKey, int] = {}
+            pairs = []
+            for _, _, key, text in todo:
+                if key not in uniq:
+                    uniq[key] = len(pairs)
+                    pairs.append((key[0], text))
+            self.warmup()
+            with self._predict_lock:
+                scores = self._model.predict(
+                    pairs, batch_size=self.batch_size, show_progress_bar=False
+                ).tolist()
+            for key, j in uniq.items():
+                self._cache_put(key, scores[j])
+            for qi, di, key, _ in todo:
+                out[qi][di] = scores[uniq[key]]
+        return out  # type: ignore[return-value]
+
+    def score(self, query: str, docs: List[Any]) -> List[float]:
+        return self.score_many([query], [docs])[0]
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max": self.cache_size}
+
+    def clear_cache(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+_RERANKER: Optional[Reranker] = None
+_RERANKER_LOCK = threading.Lock()
+
+def get_reranker() -> Reranker:
+    global _RERANKER
+    if _RERANKER is None:
+        with _RERANKER_LOCK:
+            if _RERANKER is None:
+                _RERANKER = Reranker()
+    return _RERANKER
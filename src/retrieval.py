@@ -1,30 +1,314 @@
-from typing import List, Tuple, Any, Optional   # <-- add Optional
+import hashlib, logging, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Any, Optional, Sequence, Union
 from operator import itemgetter
 
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from sentence_transformers import CrossEncoder
+import numpy as np
 
+from .chunk_store import ChunkStore, INDEX_FILE, MODULES_DIR
 from .config import settings
+from .embed_cache import cached_hf_embeddings
+from .lexical import LexicalIndex, rrf_fuse
+from .reranker import get_reranker
+from .structure import StructureIndex
+from .tracing import current, span, traced
+from .vector_index import configure_search, search_params
 
-def load_index():
-    embed = HuggingFaceEmbeddings(
-        model_name=settings.embedding_model,
-        encode_kwargs={"normalize_embeddings": True}
-    )
-    vs = FAISS.load_local(
-        str(settings.index_dir),
-        embed,
-        allow_dangerous_deserialization=True
-    )
-    return vs.as_retriever(search_kwargs={"k": settings.topk_retriever})
+log = logging.getLogger(__name__)
 
-def _rerank(query: str, docs: List[Any], top_n: int) -> List[Any]:
-    if not docs:
-        return []
-    ce = CrossEncoder(settings.reranker_model)
-    pairs = [(query, d.page_content) for d in docs]
-    scores = ce.predict(pairs).tolist()
+#One module for every query of a batch, or one per query
+ModuleFilter = Union[None, str, Sequence[Optional[str]]]
+
+class IndexState:
+    """
+    One loaded index generation: FAISS vectors, chunk store and module sub-indexes.
+    Queries hold it with acquire()/release(); once retired by a reload, the chunk
+    store is closed when the last of them lets go.
+    """
+
+    def __init__(self, index, store: ChunkStore, modules: Dict[str, Tuple[Any, np.ndarray]], version: str,
+                 lexical: Optional[LexicalIndex] = None, structure: Optional[StructureIndex] = None):
+        self.index = index
+        self.store = store
+        self.modules = modules
+        self.version = version
+        self.lexical = lexical
+        self.structure = structure
+        self._refs = 0
+        self._retired = False
+        self._ref_lock = threading.Lock()
+
+    def acquire(self) -> "IndexState":
+        with self._ref_lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        with self._ref_lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self.store.close()
+
+    def retire(self) -> None:
+        with self._ref_lock:
+            self._retired = True
+            close = self._refs == 0
+        if close:
+            self.store.close()
+
+    def module_rows(self, module: str) -> np.ndarray:
+        if module in self.modules:
+            return self.modules[module][1]
+        return self.store.module_rows(module)
+
+class RetrievalEngine:
+    """
+    Long-lived holder for the bge-m3 embedder, the FAISS index and the chunk store.
+    Load once per process (warmup) and swap in a rebuilt index with reload().
+    """
+
+    def __init__(self, index_dir: Optional[Path] = None):
+        self.index_dir = Path(index_dir or settings.index_dir)
+        self._lock = threading.RLock()
+        self._embed = None
+        self._state: Optional[IndexState] = None
+
+    def _load_embeddings(self):
+        #Repeated query strings are served from the disk embedding cache
+        return cached_hf_embeddings(settings.embedding_model, normalize=True)
+
+    def _load_state(self) -> IndexState:
+        import faiss
+        with span("index_load") as sp:
+            version = self._fingerprint()
+            index = faiss.read_index(str(self.index_dir / INDEX_FILE))
+            configure_search(index)
+            store = ChunkStore(self.index_dir)
+            #Per-module sub-indexes written by ingest (index_dir/modules/<module>.faiss)
+            modules = {}
+            for p in sorted((self.index_dir / MODULES_DIR).glob("*.faiss")):
+                modules[p.stem] = (faiss.read_index(str(p)), np.load(p.with_suffix(".rows.npy")))
+            lexical = LexicalIndex(self.index_dir) if LexicalIndex.exists(self.index_dir) else None
+            structure = StructureIndex(self.index_dir) if StructureIndex.exists(self.index_dir) else None
+            sp.set(vectors=index.ntotal)
+        return IndexState(index, store, modules, version, lexical, structure)
+
+    def _fingerprint(self) -> str:
+        """Cheap index version: names, sizes and mtimes of every file under index_dir."""
+        h = hashlib.sha1()
+        for p in sorted(self.index_dir.rglob("*")):
+            if p.is_file():
+                st = p.stat()
+                h.update(f"{p.relative_to(self.index_dir)}:{st.st_size}:{st.st_mtime_ns}".encode())
+        return h.hexdigest()[:16]
+
+    def warmup(self, rerank: bool = True) -> "RetrievalEngine":
+        with self._lock:
+            if self._embed is None:
+                self._embed = self._load_embeddings()
+                #CachedEmbeddings builds the model lazily; warm means resident
+                getattr(self._embed, "base", None)
+            if self._state is None:
+                self._state = self._load_state()
+        if rerank:
+            get_reranker().warmup()
+        return self
+
+    def reload(self, reload_models: bool = False) -> "RetrievalEngine":
+        #Build the new generation first so queries keep hitting the old one meanwhile
+        embed = self._load_embeddings() if (reload_models or self._embed is None) else self._embed
+        state = self._load_state()
+        with self._lock:
+            old, self._embed, self._state = self._state, embed, state
+        if old is not None:
+            #Queries still on the old generation keep its store open until they finish
+            old.retire()
+        #Scores of the old generation's chunks are dead weight in the LRU now
+        get_reranker().clear_cache()
+        return self
+
+    @contextmanager
+    def snapshot(self) -> Iterator[IndexState]:
+        """The current index generation, held for the whole block so a reload cannot close it mid-query."""
+        self.warmup(rerank=False)
+        with self._lock:
+            st = self._state.acquire()
+        try:
+            yield st
+        finally:
+            st.release()
+
+    @property
+    def embeddings(self):
+        return self.warmup(rerank=False)._embed
+
+    @property
+    def state(self) -> IndexState:
+        return self.warmup(rerank=False)._state
+
+    @property
+    def version(self) -> str:
+        return self.state.version
+
+    @property
+    def store(self) -> ChunkStore:
+        return self.state.store
+
+    def embed_query(self, query: str) -> np.ndarray:
+        embeddings = self.embeddings
+        with span("embed", queries=1):
+            return np.asarray([embeddings.embed_query(query)], dtype=np.float32)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """One (n, d) matrix for several queries: a single forward pass for the cache misses."""
+        embeddings = self.embeddings
+        with span("embed", queries=len(queries)):
+            return np.asarray(embeddings.embed_documents(list(queries)), dtype=np.float32).reshape(len(queries), -1)
+
+    @traced("faiss_search")
+    def search_rows(self, qv: np.ndarray, k: int, module_filter: Optional[str] = None,
+                    st: Optional[IndexState] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(global rows, L2 distances) for one query vector, best first."""
+        st = st or self.state
+        if module_filter and module_filter in st.modules:
+            #Search only the module's own vectors: full top-k, smaller scan
+            sub, rows = st.modules[module_filter]
+            D, I = sub.search(qv, min(k, sub.ntotal))
+            keep = I[0] >= 0
+            return rows[I[0][keep]], D[0][keep]
+        params = None
+        if module_filter:
+            #No sub-index for this module: restrict the global search with an ID selector
+            allowed = st.module_rows(module_filter)
+            if not len(allowed):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            params = search_params(st.index, allowed)
+        D, I = st.index.search(qv, min(k, st.index.ntotal), params=params)
+        keep = I[0] >= 0
+        return I[0][keep].astype(np.int64), D[0][keep]
+
+    @traced("bm25")
+    def lexical_rows(self, query: str, k: int, module_filter: Optional[str] = None,
+                     st: Optional[IndexState] = None) -> np.ndarray:
+        st = st or self.state
+        if st.lexical is None:
+            return np.empty(0, dtype=np.int64)
+        allowed = st.module_rows(module_filter) if module_filter else None
+        return st.lexical.search(query, k, allowed=allowed)[0]
+
+    def structural_rows(self, query: str, module_filter: Optional[str] = None,
+                        st: Optional[IndexState] = None) -> List[int]:
+        """Rows for explicit Article/Recital/Chapter references, e.g. "GDPR Article 17"."""
+        st = st or self.state
+        if st.structure is None or not settings.structural_lookup:
+            return []
+        allowed = set(st.store.module_docs(module_filter)) if module_filter else None
+        return st.structure.lookup(query, allowed_docs=allowed)
+
+    def _depth(self, dists: np.ndarray, k: int) -> int:
+        """k, or topk_retriever_max when the dense scores are flat (no hit clearly dominates)."""
+        if len(dists) <= k:
+            return k
+        sims = 1.0 - dists / 2.0  #Squared L2 between unit vectors -> cosine
+        return len(dists) if sims[0] - sims[k - 1] < settings.adaptive_flat_gap else k
+
+    def hybrid_rows(self, query: str, k: int, module_filter: Optional[str] = None, hybrid: Optional[bool] = None,
+                    qv: Optional[np.ndarray] = None, adaptive: bool = False,
+                    st: Optional[IndexState] = None) -> np.ndarray:
+        """
+        Top rows for a query; with `adaptive`, up to topk_retriever_max of them when
+        the dense scores are flat. Rows index into `st` (default: the current state).
+        """
+        st = st or self.state
+        hybrid = settings.hybrid_retrieval if hybrid is None else hybrid
+        qv = self.embed_query(query) if qv is None else qv
+        if adaptive and settings.topk_retriever_max > k:
+            #One search at the wide depth; cut back to k unless the scores are flat
+            rows, dists = self.search_rows(qv, settings.topk_retriever_max, module_filter, st)
+            k = self._depth(dists, k)
+            rows = rows[:k]
+        else:
+            rows, _ = self.search_rows(qv, k, module_filter, st)
+        sp = current()
+        if sp is not None:
+            sp.set(depth=k)
+        if hybrid:
+            #Exact references ("Article 4", "32019L0790") come in through BM25
+            lex = self.lexical_rows(query, settings.topk_lexical, module_filter, st)
+            if len(lex):
+                rows = rrf_fuse([rows, lex], k)
+        return rows
+
+    def search(self, query: str, k: int, module_filter: Optional[str] = None, hybrid: Optional[bool] = None) -> List[Any]:
+        #Only the hits are read out of the chunk store
+        with self.snapshot() as st:
+            return st.store.get(self.hybrid_rows(query, k, module_filter, hybrid, st=st))
+
+    @traced("retrieve")
+    def retrieve(self, query: str, module_filter: Optional[str] = None, qv: Optional[np.ndarray] = None,
+                 st: Optional[IndexState] = None) -> List[Any]:
+        """
+        Candidate pool for one query; pass `qv` (1, d) when the query is already
+        embedded. Every lookup of the query reads the same index generation.
+        """
+        if st is None:
+            with self.snapshot() as st:
+                return self._retrieve(query, module_filter, qv, st)
+        return self._retrieve(query, module_filter, qv, st)
+
+    def _retrieve(self, query: str, module_filter: Optional[str], qv: Optional[np.ndarray],
+                  st: IndexState) -> List[Any]:
+        k = settings.topk_retriever
+        direct = self.structural_rows(query, module_filter, st)
+        if direct and (settings.structural_skip_dense or len(direct) >= k):
+            return st.store.get(direct[:k])
+        rows = self.hybrid_rows(query, k, module_filter, qv=qv, adaptive=settings.adaptive_depth, st=st)
+        k = max(k, len(rows))
+        if direct:
+            #Seed the pool with the referenced chunks, fill the rest from search
+            seen = set(direct)
+            rows = direct + [int(r) for r in rows if int(r) not in seen]
+        return st.store.get(rows[:k])
+
+    @traced("retrieve_and_rerank")
+    def retrieve_and_rerank(self, query: str, module_filter: Optional[str] = None) -> List[Any]:
+        return _rerank(query, self.retrieve(query, module_filter), settings.topk_reranked)
+
+    def retrieve_many(self, queries: List[str], module_filter: ModuleFilter = None) -> List[List[Any]]:
+        """
+        Candidate pools for several queries with their embeddings computed in one
+        batch. `module_filter` is one module for all queries or a list, one per query.
+        """
+        if not queries:
+            return []
+        filters = list(module_filter) if isinstance(module_filter, (list, tuple)) else [module_filter] * len(queries)
+        qvs = self.embed_queries(queries)
+        with self.snapshot() as st:
+            return [self.retrieve(q, f, qv=qvs[i:i + 1], st=st) for i, (q, f) in enumerate(zip(queries, filters))]
+
+    def rerank_many(self, queries: List[str], pools: List[List[Any]]) -> List[List[Any]]:
+        """Rerank every candidate of every query in one cross-encoder batch."""
+        return _rerank_many(queries, pools, settings.topk_reranked)
+
+    @traced("retrieve_and_rerank")
+    def retrieve_and_rerank_many(self, queries: List[str], module_filter: ModuleFilter = None) -> List[List[Any]]:
+        return self.rerank_many(queries, self.retrieve_many(queries, module_filter))
+
+_ENGINE: Optional[RetrievalEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+def get_engine() -> RetrievalEngine:
+    """Process-wide engine shared by the CLIs, the agentic pipeline and the app."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = RetrievalEngine()
+    return _ENGINE
+
+def _pick(docs: List[Any], scores: List[float], top_n: int) -> List[Tuple[Any, float]]:
     ranked = sorted(zip(docs, scores), key=itemgetter(1), reverse=True)
 
     picked = []
@@ -40,14 +324,56 @@ def _rerank(query: str, docs: List[Any], top_n: int) -> List[Any]:
         per_doc_count[did] = cnt + 1
         if len(picked) >= top_n:
             break
-    return [d for d, _ in picked]
+    return picked
+
+def _select(docs: List[Any], scores: List[float], top_n: int) -> List[Any]:
+    return [d for d, _ in _pick(docs, scores, top_n)]
+
+def _confident(docs: List[Any], scores: List[float], top_n: int, exit_score: float) -> bool:
+    """Top-n is full (per-doc cap applied) and even its weakest pick clears exit_score."""
+    picked = _pick(docs[:len(scores)], scores, top_n)
+    return len(picked) >= top_n and picked[-1][1] >= exit_score
+
+def _staged_scores(queries: List[str], pools: List[List[Any]], top_n: int) -> List[List[float]]:
+    """
+    Cross-encoder scores for a prefix of each pool, in retrieval order. Pools are
+    scored rerank_stage_size candidates at a time (all live queries in one
+    predict per stage); a query stops early once _confident() holds, since its
+    remaining candidates ranked lower in retrieval.
+    """
+    reranker = get_reranker()
+    stage, exit_score = settings.rerank_stage_size, settings.rerank_exit_score
+    if exit_score is None or stage <= 0:
+        return reranker.score_many(queries, pools)
+    scores: List[List[float]] = [[] for _ in pools]
+    live = [i for i, p in enumerate(pools) if p]
+    while live:
+        got = reranker.score_many(
+            [queries[i] for i in live],
+            [pools[i][len(scores[i]):len(scores[i]) + stage] for i in live],
+        )
+        for i, sc in zip(live, got):
+            scores[i].extend(sc)
+        live = [i for i in live
+                if len(scores[i]) < len(pools[i]) and not _confident(pools[i], scores[i], top_n, exit_score)]
+    return scores
+
+def _rerank(query: str, docs: List[Any], top_n: int) -> List[Any]:
+    if not docs:
+        return []
+    return _rerank_many([query], [docs], top_n)[0]
+
+def _rerank_many(queries: List[str], pools: List[List[Any]], top_n: int) -> List[List[Any]]:
+    with span("rerank", queries=len(queries), pairs=sum(len(p) for p in pools)) as sp:
+        scores = _staged_scores(queries, pools, top_n)
+        scored = [len(sc) for sc in scores]
+        sp.set(scored=sum(scored))
+        for q, docs, n in zip(queries, pools, scored):
+            log.info("rerank scored %d/%d candidates for %r", n, len(docs), q[:80])
+        return [_select(docs[:len(sc)], sc, top_n) if docs else [] for docs, sc in zip(pools, scores)]
 
-def retrieve_and_rerank(query: str, module_filter: Optional[str] = None) -> List[Any]:  
-    retriever = load_index()
-    base_docs = retriever.invoke(query)
-    if module_filter:
-        base_docs = [d for d in base_docs if d.metadata.get("module") == module_filter]
-    return _rerank(query, base_docs, settings.topk_reranked)
+def retrieve_and_rerank(query: str, module_filter: Optional[str] = None) -> List[Any]:
+    return get_engine().retrieve_and_rerank(query, module_filter=module_filter)
 
 if __name__ == "__main__":
     import argparse, textwrap
@@ -56,11 +382,12 @@ if __name__ == "__main__":
     ap.add_argument(
         "--module",
         help="optional module filter",
-        choices=["Equality_Foundations", "Data_IP_TDM", "AI_Cyber_Gov"], 
+        choices=["Equality_Foundations", "Data_IP_TDM", "AI_Cyber_Gov"],
     )
     args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(name)s] %(message)s")
 
-    docs = retrieve_and_rerank(args.q, module_filter=args.module)  
+    docs = retrieve_and_rerank(args.q, module_filter=args.module)
     print(f"\nQuery: {args.q}")
     print(f"Module: {args.module}\n")
     for i, d in enumerate(docs, 1):
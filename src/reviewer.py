@@ -1,5 +1,7 @@
 import os
-from .ollama_client import ollama_generate  
+from typing import Iterator
+from .ollama_client import ollama_generate, ollama_stream
+from .tracing import span
 
 REVIEW_MODEL = os.getenv("WRITER_MODEL", "llama3.1:8b")
 
@@ -8,6 +10,13 @@ REVIEW_SYS = (
     "1) List any missing elements. 2) Suggest ONE follow-up question. 3) Do not restate the full answer."
 )
 
+def _prompt(question: str, answer: str) -> str:
+    return f"{REVIEW_SYS}\n\nQuestion: {question}\n\nAnswer:\n{answer}\n\nNotes:"
+
 def review(question: str, answer: str) -> str:
-    prompt = f"{REVIEW_SYS}\n\nQuestion: {question}\n\nAnswer:\n{answer}\n\nNotes:"
-    return ollama_generate(REVIEW_MODEL, prompt, temperature=0.1, max_tokens=256)
+    with span("review"):
+        return ollama_generate(REVIEW_MODEL, _prompt(question, answer), temperature=0.1, max_tokens=256)
+
+def review_stream(question: str, answer: str) -> Iterator[str]:
+    with span("review"):
+        yield from ollama_stream(REVIEW_MODEL, _prompt(question, answer), temperature=0.1, max_tokens=256)
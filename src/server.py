@@ -0,0 +1,237 @@
+import asyncio, json, logging, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from .agentic import _sources, answer as run_answer, answer_stream
+from .config import settings
+from .ollama_client import NUM_PARALLEL, OllamaError, llm_inflight, model_stats, preload, set_llm_concurrency
+from .planner import PLANNER_MODEL
+from .reranker import get_reranker
+from .retrieval import get_engine
+from .synthesizer import WRITER_MODEL, synthesize
+from .tracing import bind, recent_spans, span, summarize, traced
+
+log = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Collects concurrent submissions for up to `wait_ms` (or `max_batch` items)
+    and hands them to `fn` as one list on its own worker thread. Batches run
+    one at a time, so the embedder and the cross-encoder each see a single
+    caller as long as every retrieval goes through submit(). The dedicated
+    thread also means callers blocked on a batch from the shared executor
+    can't starve it.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int, wait_ms: float):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.wait_s = max(0.0, wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="microbatch")
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def submit(self, item: Any) -> Tuple[Any, int]:
+        """(result for `item`, size of the batch it ran in)."""
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.wait_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(self._executor, self.fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result((res, len(batch)))
+
+@traced("retrieve_batch")
+def _retrieve_batch(items: List[Tuple[str, Optional[str], bool]]) -> List[List[Any]]:
+    """(question, module, rerank) items -> docs: one embedding pass, one cross-encoder pass."""
+    engine = get_engine()
+    pools = engine.retrieve_many([q for q, _, _ in items], [m for _, m, _ in items])
+    todo = [i for i, (_, _, rerank) in enumerate(items) if rerank]
+    if todo:
+        ranked = engine.rerank_many([items[i][0] for i in todo], [pools[i] for i in todo])
+        for i, docs in zip(todo, ranked):
+            pools[i] = docs
+    return pools
+
+def _doc_json(d: Any) -> Dict[str, Any]:
+    meta = d.metadata
+    return {
+        "doc_id": meta.get("doc_id", ""),
+        "section": meta.get("section", ""),
+        "title": meta.get("title", ""),
+        "module": meta.get("module", ""),
+        "labels": meta.get("labels", []),
+        "row": meta.get("row"),
+        "text": d.page_content,
+    }
+
+class RetrieveRequest(BaseModel):
+    question: str
+    module: Optional[str] = None
+    rerank: bool = True
+
+class AskRequest(BaseModel):
+    question: str
+    module: Optional[str] = None
+
+class AnswerRequest(BaseModel):
+    question: str
+    module: Optional[str] = None
+    skip_review: bool = False
+    concurrency: Optional[int] = None
+    use_cache: bool = True
+    stream: bool = False
+
+class ReloadRequest(BaseModel):
+    reload_models: bool = False
+
+_BATCHER = MicroBatcher(_retrieve_batch, settings.server_batch_max, settings.server_batch_wait_ms)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    set_llm_concurrency(settings.server_llm_concurrency or NUM_PARALLEL)
+    #Models load once here; every request after that hits warm weights
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, get_engine().warmup)
+    #Writer first: it serves every sub-question and the review, the planner one call per question
+    try:
+        await loop.run_in_executor(None, preload, [WRITER_MODEL, PLANNER_MODEL])
+    except (OllamaError, OSError) as e:
+        log.warning("model preload failed, first questions will load on demand: %s", e)
+    _BATCHER.start()
+    yield
+    await _BATCHER.stop()
+
+app = FastAPI(title="EU Navigator", lifespan=lifespan)
+
+async def _retrieve(question: str, module: Optional[str], rerank: bool) -> Tuple[List[Any], Dict[str, Any]]:
+    t0 = time.perf_counter()
+    docs, batch = await _BATCHER.submit((question, module, rerank))
+    return docs, {"retrieve_rerank_s" if rerank else "retrieve_s": time.perf_counter() - t0, "batch_size": batch}
+
+def _batched_retriever(loop: asyncio.AbstractEventLoop) -> Callable[[List[str], Optional[str]], List[List[Any]]]:
+    """agentic.Retriever for pipeline threads: sub-questions join the shared micro-batches on `loop`."""
+    async def gather(subqs: List[str], module: Optional[str]) -> List[List[Any]]:
+        got = await asyncio.gather(*(_BATCHER.submit((q, module, True)) for q in subqs))
+        return [docs for docs, _ in got]
+
+    def run(subqs: List[str], module: Optional[str]) -> List[List[Any]]:
+        return asyncio.run_coroutine_threadsafe(gather(subqs, module), loop).result()
+    return run
+
+@app.get("/health")
+def health() -> Dict[str, Any]:
+    engine = get_engine()
+    return {
+        "index_version": engine.version,
+        "chunks": len(engine.store),
+        "llm_inflight": llm_inflight(),
+        "llm": model_stats(),
+        "reranker_cache": get_reranker().cache_info(),
+    }
+
+@app.post("/reload")
+async def reload(req: ReloadRequest) -> Dict[str, Any]:
+    """
+    Swap in a rebuilt index without a restart. Requests in flight finish on the
+    old generation; its chunk store closes once the last of them is done.
+    """
+    engine = get_engine()
+    before = engine.version
+    t0 = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, bind(engine.reload), req.reload_models)
+    return {"previous_version": before, "index_version": engine.version, "chunks": len(engine.store),
+            "reload_s": time.perf_counter() - t0}
+
+@app.get("/traces/summary")
+def traces_summary() -> Dict[str, Any]:
+    """p50/p95 per stage over the spans this process has recorded recently."""
+    return summarize(recent_spans())
+
+@app.post("/retrieve")
+async def retrieve(req: RetrieveRequest) -> Dict[str, Any]:
+    t_start = time.perf_counter()
+    docs, timings = await _retrieve(req.question, req.module, req.rerank)
+    timings["total_s"] = time.perf_counter() - t_start
+    return {"question": req.question, "docs": [_doc_json(d) for d in docs], "timings": timings}
+
+@app.post("/ask")
+async def ask(req: AskRequest) -> Dict[str, Any]:
+    """Single-shot RAG: batched retrieve + rerank, then one synthesis call."""
+    t_start = time.perf_counter()
+    docs, timings = await _retrieve(req.question, req.module, True)
+    t0 = time.perf_counter()
+    with span("ask", batch_size=timings["batch_size"]):
+        text = await asyncio.get_running_loop().run_in_executor(None, bind(synthesize), req.question, docs)
+    timings["synthesize_s"] = time.perf_counter() - t0
+    timings["total_s"] = time.perf_counter() - t_start
+    return {"question": req.question, "answer": text, "sources": _sources(docs), "timings": timings}
+
+@app.post("/answer")
+async def answer(req: AnswerRequest):
+    """
+    Full agentic pipeline. Its sub-questions go through the same micro-batcher
+    as /retrieve and /ask; generations share the server-wide LLM slots. With
+    `stream: true` the answer_stream() events come back as NDJSON.
+    """
+    retrieve = _batched_retriever(asyncio.get_running_loop())
+    if req.stream:
+        events = answer_stream(req.question, module=req.module, skip_review=req.skip_review,
+                               use_cache=req.use_cache, retrieve=retrieve)
+        lines = (json.dumps(ev) + "\n" for ev in events)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        lambda: run_answer(req.question, module=req.module, skip_review=req.skip_review,
+                           concurrency=req.concurrency, use_cache=req.use_cache, retrieve=retrieve),
+    )
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    ap = argparse.ArgumentParser(description="EU Navigator query service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8008)
+    args = ap.parse_args()
+    #One process: the models, caches and batcher live in it
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
@@ -0,0 +1,168 @@
+import json, re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+STRUCTURE_FILE = "structure.json"
+
+#Real headings sit on their own line in the EUR-Lex text exports ("Article 17 ", "CHAPTER III ")
+ARTICLE_HEAD = re.compile(r"^[ \t]*Article[ \t]+(\d+[a-z]?)[ \t]*$", re.MULTILINE)
+CHAPTER_HEAD = re.compile(r"^[ \t]*CHAPTER[ \t]+([IVXLC]+)[ \t]*$", re.MULTILINE | re.IGNORECASE)
+#Recitals are "(18)" at line start, but only in the preamble (definitions reuse the same form)
+RECITAL_HEAD = re.compile(r"^[ \t]*\((\d{1,3})\)", re.MULTILINE)
+ENACTING = re.compile(r"HA(?:VE|S) ADOPTED TH(?:IS|E PRESENT)", re.IGNORECASE)
+
+#References in questions: "Article 17", "Art. 4", "Recital 18", "Chapter III"
+QUERY_REF = re.compile(r"\b(article|art\.|recital|chapter)\s+(\d+[a-z]?|[ivxlc]+)\b", re.IGNORECASE)
+CELEX = re.compile(r"(?<![0-9a-z])(3\d{4}[a-z]\d{4})(?![0-9a-z])", re.IGNORECASE)
+
+#Common names -> CELEX / OJ number fragment of the doc_id
+NAMED_ACTS = {
+    "gdpr": "32016R0679",
+    "general data protection regulation": "32016R0679",
+    "dsm": "32019L0790",
+    "cdsm": "32019L0790",
+    "copyright directive": "32019L0790",
+    "digital single market": "32019L0790",
+    "software directive": "32009L0024",
+    "computer programs directive": "32009L0024",
+    "ai act": "202401689",
+    "artificial intelligence act": "202401689",
+    "product liability directive": "202402853",
+    "pld": "202402853",
+    "race equality directive": "32000L0043",
+    "employment equality directive": "32000L0078",
+    "gender goods and services directive": "32004L0113",
+    "recast directive": "32006L0054",
+}
+
+def label(kind: str, num: str) -> str:
+    kind = kind.lower().rstrip(".")
+    return f"{'article' if kind == 'art' else kind}_{num.lower()}"
+
+def display(lbl: str) -> str:
+    kind, _, num = lbl.partition("_")
+    return f"{kind.capitalize()} {num.upper() if kind == 'chapter' else num}"
+
+def label_spans(raw: str) -> List[Tuple[str, int, int]]:
+    """(label, start, end) char spans for every heading; a span runs to the next heading of its kind."""
+    out: List[Tuple[str, int, int]] = []
+    enact = ENACTING.search(raw)
+    heads = [
+        ("article", ARTICLE_HEAD.finditer(raw, enact.end() if enact else 0)),
+        ("chapter", CHAPTER_HEAD.finditer(raw, enact.end() if enact else 0)),
+        ("recital", RECITAL_HEAD.finditer(raw, 0, enact.start()) if enact else iter(())),
+    ]
+    for kind, it in heads:
+        ms = list(it)
+        for i, m in enumerate(ms):
+            end = ms[i + 1].start() if i + 1 < len(ms) else len(raw)
+            out.append((label(kind, m.group(1)), m.start(), end))
+    return out
+
+def locate(raw: str, pieces: Iterable[str]) -> List[int]:
+    """Char offset of each piece in raw (pieces appear in order, possibly overlapping); -1 if not found."""
+    out, cursor = [], 0
+    for p in pieces:
+        pos = raw.find(p, cursor)
+        if pos < 0:
+            pos = raw.find(p)
+        out.append(pos)
+        if pos >= 0:
+            cursor = pos + 1
+    return out
+
+def chunk_labels(spans: Sequence[Tuple[str, int, int]], start: int, length: int) -> List[str]:
+    """Labels whose span overlaps [start, start+length); articles first so they make the citation."""
+    if start < 0:
+        return []
+    end = start + length
+    hits = [lbl for lbl, s, e in spans if s < end and e > start]
+    order = {"article": 0, "recital": 1, "chapter": 2}
+    return sorted(set(hits), key=lambda l: (order.get(l.partition("_")[0], 9), hits.index(l)))
+
+def doc_aliases(doc_id: str) -> Set[str]:
+    """Lower-case names a question may use for a document: CELEX number and act number."""
+    out = set()
+    m = CELEX.search(doc_id)
+    if m:
+        celex = m.group(1).lower()
+        out.add(celex)
+        out.add(f"{celex[1:5]}/{int(celex[6:])}")
+    m = re.search(r"OJ_L_(\d{4})(\d{5})", doc_id, re.IGNORECASE)
+    if m:
+        out.add(f"{m.group(1)}/{int(m.group(2))}")
+    for name, frag in NAMED_ACTS.items():
+        if frag.lower() in doc_id.lower():
+            out.add(name)
+    return out
+
+class StructureIndexBuilder:
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, List[int]]] = {}
+        self.aliases: Dict[str, str] = {}
+
+    def add(self, row: int, doc_id: str, labels: Iterable[str]) -> None:
+        if doc_id not in self.docs:
+            self.docs[doc_id] = {}
+            for a in doc_aliases(doc_id):
+                self.aliases[a] = doc_id
+        for lbl in labels:
+            self.docs[doc_id].setdefault(lbl, []).append(row)
+
+    def save(self, root: Path) -> None:
+        (Path(root) / STRUCTURE_FILE).write_text(
+            json.dumps({"docs": self.docs, "aliases": self.aliases}), encoding="utf-8"
+        )
+
+class StructureIndex:
+    """(doc_id, Article/Recital/Chapter) -> chunk rows, for citation-style questions."""
+
+    def __init__(self, root: Path):
+        data = json.loads((Path(root) / STRUCTURE_FILE).read_text(encoding="utf-8"))
+        self.docs: Dict[str, Dict[str, List[int]]] = data["docs"]
+        self.aliases: Dict[str, str] = data["aliases"]
+        self._alias_re = re.compile(
+            r"\b(" + "|".join(re.escape(a) for a in sorted(self.aliases, key=len, reverse=True)) + r")\b",
+            re.IGNORECASE,
+        ) if self.aliases else None
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (Path(root) / STRUCTURE_FILE).exists()
+
+    def parse(self, query: str) -> Tuple[List[str], List[str]]:
+        """(doc_ids named in the query, structural labels referenced)."""
+        labels = [label(k, n) for k, n in QUERY_REF.findall(query)]
+        docs: List[str] = []
+        if self._alias_re is not None:
+            for m in self._alias_re.finditer(query):
+                did = self.aliases[m.group(1).lower()]
+                if did not in docs:
+                    docs.append(did)
+        return docs, labels
+
+    def lookup(self, query: str, allowed_docs: Optional[Set[str]] = None) -> List[int]:
+        """
+        Rows for explicit references. Without a named document, a label is only
+        used when exactly one (allowed) document has it.
+        """
+        docs, labels = self.parse(query)
+        if not labels:
+            return []
+        if not docs:
+            for lbl in labels:
+                owners = [d for d, m in self.docs.items()
+                          if lbl in m and (allowed_docs is None or d in allowed_docs)]
+                if len(owners) == 1 and owners[0] not in docs:
+                    docs.append(owners[0])
+        rows: List[int] = []
+        seen: Set[int] = set()
+        for did in docs:
+            if allowed_docs is not None and did not in allowed_docs:
+                continue
+            for lbl in labels:
+                for r in self.docs.get(did, {}).get(lbl, []):
+                    if r not in seen:
+                        seen.add(r)
+                        rows.append(r)
+        return rows
@@ -1,7 +1,9 @@
 import os
 import re
-from typing import List
-from .ollama_client import ollama_generate
+from typing import Dict, Iterator, List, Tuple
+from .context import pack_context
+from .ollama_client import ollama_generate, ollama_stream
+from .tracing import span
 
 WRITER_MODEL = os.getenv("WRITER_MODEL", "llama3.1:8b")
 
@@ -24,25 +26,27 @@ SYNTH_SYS = (
 #     "If unsure, say 'Not enough evidence in provided context.'"
 # )
 
-def _pack_context(docs) -> str:
-    lines = []
-    for i, d in enumerate(docs, 1):
-        doc_id = d.metadata["doc_id"]
-        section = d.metadata.get("section", "")
-        # Give the model a copyable citation token
-        citation = f"[{doc_id}: {section}]" if section else f"[{doc_id}]"
-        lines.append(f"[{i}] CITATION: {citation}")
-        lines.append(d.page_content.strip()[:4000])
-        lines.append("")
-    return "\n".join(lines)
-
 def _format_output(text: str) -> str:
     text = re.sub(r"(?<!\n)•", "\n•", text)
     text = re.sub(r"\n{3,}", "\n\n", text)
     return text.strip()
 
+def _prompt(question: str, docs) -> Tuple[str, Dict[str, int]]:
+    #Neighbouring chunks merged, overlap stripped, fitted to context_budget_tokens;
+    #each block keeps a copyable citation token
+    ctx, stats = pack_context(docs)
+    return f"{SYNTH_SYS}\n\nQuestion:\n{question}\n\nContext (use only this):\n{ctx}\n\nAnswer:", stats
+
 def synthesize(question: str, docs):
-    ctx = _pack_context(docs)
-    prompt = f"{SYNTH_SYS}\n\nQuestion:\n{question}\n\nContext (use only this):\n{ctx}\n\nAnswer:"
-    raw = ollama_generate(WRITER_MODEL, prompt, temperature=0.15, max_tokens=900)
-    return _format_output(raw)
+    with span("synthesize", docs=len(docs)) as sp:
+        prompt, stats = _prompt(question, docs)
+        sp.set(**stats)
+        raw = ollama_generate(WRITER_MODEL, prompt, temperature=0.15, max_tokens=900)
+        return _format_output(raw)
+
+def synthesize_stream(question: str, docs) -> Iterator[str]:
+    """Raw tokens as the writer produces them; run _format_output on the joined text."""
+    with span("synthesize", docs=len(docs)) as sp:
+        prompt, stats = _prompt(question, docs)
+        sp.set(**stats)
+        yield from ollama_stream(WRITER_MODEL, prompt, temperature=0.15, max_tokens=900)
@@ -0,0 +1,225 @@
+import contextvars, functools, json, os, threading, time, uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+#Set to a path to append every finished trace there as JSONL (one line per span)
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+RECENT_SPANS = int(os.getenv("TRACE_RECENT_SPANS", "20000"))
+BREAKDOWN_MAX_REPEATS = 8
+
+class Trace:
+    """All spans of one top-level operation (an answer, an ingest run)."""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.spans: List["Span"] = []
+
+class Span:
+    """
+    One timed stage. Parent and trace are taken from the current context when
+    the span starts; a span with no parent is the root of a new trace.
+    `attrs` carries stage facts (tokens, ttft_s, pairs, ...).
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "trace", "attrs", "start", "_t0", "duration_s")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs: Any):
+        parent = parent if parent is not None else _CURRENT.get()
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace: Trace = parent.trace if parent is not None else Trace(name)
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_s: Optional[float] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def end(self) -> None:
+        if self.duration_s is not None:
+            return
+        self.duration_s = time.perf_counter() - self._t0
+        _RECENT.append(self)
+        self.trace.spans.append(self)
+        if self.parent_id is None and TRACE_PATH:
+            export_jsonl(TRACE_PATH, self.trace.spans)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_s": self.duration_s,
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+_CURRENT: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("span", default=None)
+_RECENT: "deque[Span]" = deque(maxlen=RECENT_SPANS)
+_EXPORT_LOCK = threading.Lock()
+
+@contextmanager
+def _activate(sp: Span) -> Iterator[Span]:
+    prev = _CURRENT.get()
+    #set() rather than reset(token): a generator may be resumed from another context
+    _CURRENT.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.set(error=type(e).__name__)
+        raise
+    finally:
+        _CURRENT.set(prev)
+        sp.end()
+
+def span(name: str, parent: Optional[Span] = None, **attrs: Any):
+    """Time a stage; spans opened inside it (same thread or bind()) become its children."""
+    return _activate(Span(name, parent=parent, **attrs))
+
+def start_span(name: str, **attrs: Any) -> Span:
+    """Span that does not become the current one; for leaves and generators. Call .end()."""
+    return Span(name, **attrs)
+
+def trace_stream(name: str, gen: Iterator[Any], **attrs: Any) -> Iterator[Any]:
+    """
+    Drive generator `gen` under a trace. The trace (and whatever span `gen`
+    left open) is re-activated around every step, so the spans stay linked
+    even if each step is resumed from a different context (e.g. a threadpool).
+    """
+    root = start_span(name, **attrs)
+    inner: Optional[Span] = root
+    try:
+        while True:
+            prev = _CURRENT.get()
+            _CURRENT.set(inner)
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                inner = _CURRENT.get()
+                _CURRENT.set(prev)
+            yield item
+    except BaseException as e:
+        root.set(error=type(e).__name__)
+        raise
+    finally:
+        gen.close()
+        root.end()
+
+def traced(name: Optional[str] = None) -> Callable:
+    def wrap(fn: Callable) -> Callable:
+        label = name or fn.__name__
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
+
+def bind(fn: Callable) -> Callable:
+    """Run `fn` in worker threads under the caller's current span."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+def current() -> Optional[Span]:
+    return _CURRENT.get()
+
+def recent_spans() -> List[Span]:
+    return list(_RECENT)
+
+#Export / summaries
+def export_jsonl(path, spans: Iterable[Span]) -> None:
+    lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+    with _EXPORT_LOCK:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+def load_jsonl(path) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+def summarize(spans: Iterable[Any]) -> Dict[str, Dict[str, float]]:
+    """Per stage name: count, p50/p95/max ms, plus mean token counts and TTFT where recorded."""
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        d = s.to_dict() if isinstance(s, Span) else s
+        if d.get("duration_s") is not None:
+            by_name.setdefault(d["name"], []).append(d)
+    out = {}
+    for name, ds in sorted(by_name.items()):
+        ms = sorted(d["duration_s"] * 1000 for d in ds)
+        row = {"count": len(ms), "p50_ms": _pct(ms, 0.5), "p95_ms": _pct(ms, 0.95), "max_ms": ms[-1]}
+        for key in ("tokens", "prompt_tokens", "ctx_tokens", "ctx_tokens_unpacked", "ttft_s", "load_s"):
+            vals = [d["attrs"][key] for d in ds if key in d.get("attrs", {})]
+            if vals:
+                row[f"mean_{key}"] = sum(vals) / len(vals)
+        out[name] = row
+    return out
+
+def breakdown(root: Span) -> str:
+    """Indented per-stage timing tree for one trace."""
+    spans = root.trace.spans
+    children: Dict[Optional[str], List[Span]] = {}
+    for s in spans:
+        children.setdefault(s.parent_id, []).append(s)
+    lines: List[str] = []
+
+    def walk(s: Span, depth: int) -> None:
+        extra = " ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in s.attrs.items())
+        lines.append(f"{'  ' * depth}{s.name:<{28 - 2 * depth}} {s.duration_s * 1000:9.1f} ms  {extra}".rstrip())
+        kids = sorted(children.get(s.span_id, []), key=lambda c: c.start)
+        counts: Dict[str, int] = {}
+        for c in kids:
+            counts[c.name] = counts.get(c.name, 0) + 1
+        shown = set()
+        for c in kids:
+            if counts[c.name] <= BREAKDOWN_MAX_REPEATS:
+                walk(c, depth + 1)
+            elif c.name not in shown:
+                #Repeated stages (e.g. ingest embed batches) collapse to one line
+                shown.add(c.name)
+                ms = sorted(x.duration_s * 1000 for x in kids if x.name == c.name)
+                label = f"{c.name} x{len(ms)}"
+                lines.append(f"{'  ' * (depth + 1)}{label:<{26 - 2 * depth}} {sum(ms):9.1f} ms  "
+                             f"p50={_pct(ms, 0.5):.1f}ms p95={_pct(ms, 0.95):.1f}ms")
+    walk(root, 0)
+    return "\n".join(lines)
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'stage':<24} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}"]
+    for name, r in summary.items():
+        extra = ""
+        if "mean_ttft_s" in r:
+            extra += f"  ttft={r['mean_ttft_s'] * 1000:.0f}ms"
+        if "mean_tokens" in r:
+            extra += f"  tokens={r['mean_tokens']:.0f}"
+        if "mean_prompt_tokens" in r:
+            extra += f"  prompt={r['mean_prompt_tokens']:.0f}"
+        if "mean_ctx_tokens" in r:
+            extra += f"  ctx={r['mean_ctx_tokens']:.0f}/{r['mean_ctx_tokens_unpacked']:.0f}"
+        lines.append(f"{name:<24} {r['count']:>5} {r['p50_ms']:>10.1f} {r['p95_ms']:>10.1f} {r['max_ms']:>10.1f}{extra}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Summarize exported traces (p50/p95 per stage)")
+    ap.add_argument("path", help="JSONL written via TRACE_PATH")
+    ap.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = ap.parse_args()
+    summary = summarize(load_jsonl(args.path))
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
@@ -0,0 +1,81 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq", "ivfsq8")
+
+def _nlist(n: int) -> int:
+    #~4*sqrt(n) lists, but keep >= 39 training points per centroid (faiss warns below that)
+    want = settings.ivf_nlist or int(4 * math.sqrt(n))
+    return max(1, min(want, n // 39))
+
+def build_index(vectors: np.ndarray, index_type: Optional[str] = None):
+    """
+    Build a FAISS index of the configured type over `vectors` (L2 metric, same
+    as the flat baseline; bge-m3 vectors are normalized so L2 order == cosine order).
+    """
+    import faiss
+    index_type = (index_type or settings.index_type).lower()
+    n, d = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, settings.hnsw_m)
+        index.hnsw.efConstruction = settings.hnsw_ef_construction
+    elif index_type in ("ivfpq", "ivfsq8"):
+        quantizer = faiss.IndexFlatL2(d)
+        nlist = _nlist(n)
+        if index_type == "ivfpq":
+            if d % settings.pq_m:
+                raise ValueError(f"pq_m={settings.pq_m} must divide the embedding dim {d}")
+            #PQ codebooks need >= 2^nbits training points; shrink nbits on tiny corpora
+            nbits = max(1, min(settings.pq_nbits, int(math.log2(max(n, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, settings.pq_m, nbits)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, faiss.ScalarQuantizer.QT_8bit)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index_type {index_type!r}; expected one of {INDEX_TYPES}")
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+def configure_search(index) -> None:
+    """Apply query-time knobs (efSearch / nprobe) to a freshly built or loaded index."""
+    import faiss
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.hnsw_ef_search
+        return
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except (RuntimeError, ValueError):
+        return
+    ivf.nprobe = min(settings.ivf_nprobe, ivf.nlist)
+
+def search_params(index, allowed: np.ndarray):
+    """
+    SearchParameters restricting `index` to the `allowed` ids. IVF and HNSW
+    indexes reject the plain type and would drop their nprobe / efSearch, so
+    the subclass matching the index is built with the index's own setting.
+    """
+    import faiss
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(allowed, dtype=np.int64))
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=sel)
+
+def describe(index) -> str:
+    import faiss
+    kind = type(index).__name__
+    if isinstance(index, faiss.IndexHNSW):
+        return f"{kind}(M={index.hnsw.nb_neighbors(1)}, efSearch={index.hnsw.efSearch})"
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        return f"{kind}(nlist={ivf.nlist}, nprobe={ivf.nprobe})"
+    except (RuntimeError, ValueError):
+        return kind